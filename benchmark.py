@@ -0,0 +1,283 @@
+import gc
+import io
+import sys
+import json
+import time
+import argparse
+import threading
+import http.server
+import tracemalloc
+import contextlib
+import ordinals_parser as ord
+import hex_codec
+
+# Offline benchmarks for the parser, codec, tokenizer and fetch layers. Every input is
+# generated here and the fetch benchmarks talk to a stub API on localhost, nothing
+# touches the network.
+#
+#   python3 benchmark.py                   Run all benchmarks and compare with the baseline
+#   python3 benchmark.py --save-baseline   Run all benchmarks and store the results as the new baseline
+#   python3 benchmark.py -k codec          Only run benchmarks whose name contains 'codec'
+
+BASELINE_FILE = 'benchmark_baseline.json'
+
+# Inscription body sizes every benchmark is run with
+DEFAULT_SIZES = [1024, 64 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+
+# Results slower than the baseline by more than this fraction are reported as regressions
+DEFAULT_TOLERANCE = 0.25
+
+# Minimum time spent timing each benchmark
+MIN_TIME = 0.2
+
+# Ord splits inscription bodies into pushes of this many bytes
+CHUNK_SIZE = 520
+
+def _push(data, style):
+    length = len(data)
+    if style == 'direct':
+        return bytes([length]) + data
+    if style == 'pushdata1':
+        return b'\x4c' + length.to_bytes(1, 'little') + data
+    if style == 'pushdata2':
+        return b'\x4d' + length.to_bytes(2, 'little') + data
+    return b'\x4e' + length.to_bytes(4, 'little') + data
+
+def generate_envelope(body, mime_type=b'image/webp', style='pushdata2'):
+    # Direct pushes carry at most 75 bytes and PUSHDATA1 at most 255, so the body is split accordingly
+    chunk_size = {'direct': 75, 'pushdata1': 255}.get(style, CHUNK_SIZE)
+    envelope = [ord.ENVELOPE_START, b'\x01\x01', _push(mime_type, 'direct'), b'\x00']
+    for start in range(0, len(body), chunk_size):
+        envelope.append(_push(body[start:start + chunk_size], style))
+    envelope.append(b'\x68')
+    return b''.join(envelope)
+
+def generate_witness(body_size, style='pushdata2', envelopes=1, malformed_tail=False):
+    # Synthetic tapscript witness element: <pubkey> OP_CHECKSIG followed by the envelopes.
+    # With malformed_tail the last envelope is cut off in the middle of a push.
+    body = bytes(index % 251 for index in range(body_size // envelopes))
+    script = [b'\x20' + b'\x11' * 32 + b'\xac']
+    script.extend(generate_envelope(body, style=style) for _ in range(envelopes))
+    witness = b''.join(script)
+    if malformed_tail:
+        witness = witness[:-CHUNK_SIZE // 2]
+    return witness
+
+def generate_transaction(witness_elements, inputs=1):
+    # Serialized segwit transaction spending `inputs` inputs with the given witness each
+    def varint(value):
+        if value < 0xfd:
+            return bytes([value])
+        if value <= 0xffff:
+            return b'\xfd' + value.to_bytes(2, 'little')
+        return b'\xfe' + value.to_bytes(4, 'little')
+
+    parts = [b'\x02\x00\x00\x00', b'\x00\x01', varint(inputs)]
+    for index in range(inputs):
+        parts.append(b'\x01' * 32 + index.to_bytes(4, 'little') + b'\x00' + b'\xfd\xff\xff\xff')
+    parts.append(b'\x01' + (546).to_bytes(8, 'little') + b'\x01\x51')
+    for _ in range(inputs):
+        parts.append(varint(len(witness_elements)))
+        for element in witness_elements:
+            parts.append(varint(len(element)) + element)
+    parts.append(b'\x00\x00\x00\x00')
+    return b''.join(parts)
+
+def generate_block(transactions):
+    header = b'\x02\x00\x00\x00' + b'\x00' * 68 + b'\xff\xff\x00\x1d' + b'\x00' * 4
+    return header + bytes([len(transactions)]) + b''.join(transactions)
+
+def recorded_sample():
+    # The recorded inscription hex that ships with simple_hex_converter.py
+    import simple_hex_converter
+    with open(simple_hex_converter.__file__) as file:
+        source = file.read()
+    start = source.index('hex_string = "') + len('hex_string = "')
+    return source[start:source.index('"', start)]
+
+def _legacy_decode(hex_string):
+    # The per-byte decoder the codec replaced, kept as a reference point
+    return bytes(int(hex_string[i:i+2], 16) for i in range(0, len(hex_string), 2))
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    # Serves the same transaction for every txid, as raw bytes for tx/<id>/raw and
+    # as Esplora-style JSON for tx/<id>
+    raw_tx = b''
+    json_tx = b''
+
+    def do_GET(self):
+        body = self.raw_tx if self.path.endswith('/raw') else self.json_tx
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_api(raw_tx, witness):
+    # Starts a local HTTP server standing in for the public API and returns it with
+    # an OrdinalsClient that only talks to it
+    handler = type('StubHandler', (_StubHandler,), {
+        'raw_tx': raw_tx,
+        'json_tx': json.dumps({'status': {'confirmed': True}, 'vin': [{'witness': [witness.hex()]}]}).encode(),
+    })
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # The stub is not the public API, pacing it would only measure the rate limiter
+    client = ord.OrdinalsClient(use_public_api=True, endpoints=[f"http://127.0.0.1:{server.server_port}/"],
+                                rate_limit=False)
+    return server, client
+
+def build_benchmarks(size):
+    # Returns (name, function, bytes processed per call) triples for one body size
+    witness = generate_witness(size)
+    witness_hex = witness.hex()
+    multi_witness = generate_witness(size, envelopes=8)
+    raw_tx = generate_transaction([b'\x01' * 64, multi_witness, b'\xc0' + b'\x22' * 32], inputs=2)
+    raw_block = generate_block([raw_tx] * 4)
+    inscription = ord.parse_envelope(witness)
+    body_hex = inscription.hex()
+    server, client = start_stub_api(raw_tx, witness)
+    tx_id = ord.deserialize_transaction(raw_tx).txid  # Fetched raw transactions are checked against it
+
+    def fetch_inscriptions():
+        # Raw transaction over HTTP, deserialized and scanned for envelopes
+        client.raw_transaction_store.clear()
+        return ord.find_envelopes(client.get_witness_stacks(tx_id))
+
+    def fetch_json_witness():
+        # The JSON transaction over HTTP and the witness joined from it
+        client.transaction_store.clear()
+        return client.get_witness_data(tx_id)
+
+    benchmarks = [
+        ('parser.find_envelope_and_inscription', lambda: ord.find_envelope_and_inscription(witness_hex), len(witness)),
+        ('parser.parse_envelope', lambda: ord.parse_envelope(witness).body, len(witness)),
+        ('parser.parse_envelope.direct_pushes', (lambda data: lambda: ord.parse_envelope(data).body)(generate_witness(size, 'direct')), size),
+        ('parser.parse_envelope.pushdata1', (lambda data: lambda: ord.parse_envelope(data).body)(generate_witness(size, 'pushdata1')), size),
+        ('parser.parse_envelope.pushdata4', (lambda data: lambda: ord.parse_envelope(data).body)(generate_witness(size, 'pushdata4')), size),
+        ('parser.parse_envelope.malformed_tail', (lambda data: lambda: ord.parse_envelope(data))(generate_witness(size, malformed_tail=True)), size),
+        ('parser.find_envelopes.multiple', lambda: ord.find_envelopes([[multi_witness]]), len(multi_witness)),
+        ('codec.decode_hex', lambda: hex_codec.decode_hex(body_hex), len(body_hex) // 2),
+        ('codec.decode_hex_tolerant', lambda: hex_codec.decode_hex_tolerant(body_hex), len(body_hex) // 2),
+        ('tokenizer.iter_script_tokens', lambda: sum(1 for _ in ord.iter_script_tokens(witness)), len(witness)),
+        ('tokenizer.annotate_envelopes', lambda: ord.annotate_envelopes(witness), len(witness)),
+        ('parser.iter_block_inscriptions', lambda: sum(1 for _ in ord.iter_block_inscriptions(raw_block)), len(raw_block)),
+        ('fetch.get_witness_stacks', fetch_inscriptions, len(raw_tx)),
+        ('fetch.get_witness_data', fetch_json_witness, len(witness) * 2),
+    ]
+    if size <= 64 * 1024:
+        # Far too slow to run at megabyte sizes
+        benchmarks.append(('codec.legacy_per_byte_decode', lambda: _legacy_decode(body_hex), len(body_hex) // 2))
+    return benchmarks, server, client
+
+def measure(function, processed_bytes):
+    # Best time per call over repeated runs, then one traced run for memory: the peak
+    # traced memory during the call, and the memory blocks the call allocated that are
+    # still alive once it returned (its result and anything it cached). tracemalloc
+    # cannot count blocks that were allocated and freed again during the call.
+    # Warnings the parser prints for malformed input are swallowed.
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _measure(function, processed_bytes)
+
+def _measure(function, processed_bytes):
+    gc.collect()
+    best = float('inf')
+    deadline = time.perf_counter() + MIN_TIME
+    runs = 0
+    while runs < 3 or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+        runs += 1
+
+    tracemalloc.start()
+    result = function()
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        'seconds': best,
+        'mb_per_second': processed_bytes / best / 1e6,
+        'retained_blocks': sum(stat.count for stat in snapshot.statistics('filename')),
+        'peak_bytes': peak,
+    }
+
+def run_benchmarks(sizes, name_filter=None):
+    results = {}
+    for size in sizes:
+        benchmarks, server, client = build_benchmarks(size)
+        try:
+            for name, function, processed_bytes in benchmarks:
+                if name_filter and name_filter not in name:
+                    continue
+                key = f"{name}[{size}]"
+                results[key] = measure(function, processed_bytes)
+                result = results[key]
+                print(f"{key:<55} {result['mb_per_second']:>10.1f} MB/s {result['peak_bytes'] / 1e6:>10.2f} MB peak "
+                      f"{result['retained_blocks']:>8} blocks retained")
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+    # The recorded sample is small, it is reported separately from the synthetic sizes
+    sample_hex = recorded_sample()
+    for name, function in [('codec.decode_hex.recorded_sample', lambda: hex_codec.decode_hex(sample_hex)),
+                           ('codec.decode_hex_tolerant.recorded_sample', lambda: hex_codec.decode_hex_tolerant(sample_hex))]:
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(function, len(sample_hex) // 2)
+        print(f"{name:<55} {results[name]['mb_per_second']:>10.1f} MB/s")
+    return results
+
+def compare_with_baseline(results, baseline, tolerance):
+    # Returns the names of the benchmarks that got slower or use more memory than the baseline allows
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        slower = result['seconds'] > previous['seconds'] * (1 + tolerance)
+        bigger = result['peak_bytes'] > previous['peak_bytes'] * (1 + tolerance) + 64 * 1024
+        if slower or bigger:
+            regressions.append(key)
+            print(f"Regression in {key}: {previous['mb_per_second']:.1f} -> {result['mb_per_second']:.1f} MB/s, "
+                  f"{previous['peak_bytes'] / 1e6:.2f} -> {result['peak_bytes'] / 1e6:.2f} MB peak")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the parser, codec, tokenizer and fetch layers.")
+    parser.add_argument('-k', dest='name_filter', help="Only run benchmarks whose name contains this string")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Inscription body sizes in bytes")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline file to compare with or save to")
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown before a result counts as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.name_filter)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print(f"No baseline found at {args.baseline}. Run with --save-baseline to create one.")
+        return 0
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        return 1
+    print(f"No regressions against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import os
+import re
+import sys
+import mmap
+import sqlite3
+import argparse
+import ordinals_parser as ord
+from node_config import LOCAL_NODE_BLOCKS_DIR
+
+# Message start bytes that precede every block record in the blk*.dat files
+NETWORK_MAGIC = {
+    'main': bytes.fromhex('f9beb4d9'),
+    'test': bytes.fromhex('0b110907'),
+    'signet': bytes.fromhex('0a03cf40'),
+    'regtest': bytes.fromhex('fabfb5da'),
+}
+
+# Name of the sidecar index written next to the scanner's working directory
+DEFAULT_INDEX_FILE = 'blk_index.sqlite'
+
+_BLOCK_FILE_PATTERN = re.compile(r'^blk(\d{5})\.dat$')
+
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    hash TEXT PRIMARY KEY,
+    prev_hash TEXT NOT NULL,
+    file_number INTEGER NOT NULL,
+    data_offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS blocks_height ON blocks (height);
+CREATE TABLE IF NOT EXISTS files (
+    file_number INTEGER PRIMARY KEY,
+    scanned_length INTEGER NOT NULL
+);
+"""
+
+class BlockFileScanner(object):
+    # Reads blocks straight from Bitcoin Core's blocks/blk*.dat files without RPC.
+    # Files are memory-mapped and, unless the node obfuscates them with xor.dat,
+    # blocks and witnesses are handed to the envelope parser as memoryview slices
+    # of the mapping. Heights come from a sidecar SQLite index built by build_index.
+    def __init__(self, blocks_dir=LOCAL_NODE_BLOCKS_DIR, index_path=DEFAULT_INDEX_FILE, network='main'):
+        self.blocks_dir = os.path.expanduser(blocks_dir)
+        self.magic = NETWORK_MAGIC[network]
+        self._xor_key = self._load_xor_key()
+        self._maps = {}
+        self._index = sqlite3.connect(index_path)
+        self._index.executescript(_INDEX_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for file_map in self._maps.values():
+            try:
+                file_map.close()
+            except BufferError:
+                # Inscriptions handed out still reference the mapping, the
+                # garbage collector will unmap it once they are released
+                pass
+        self._maps.clear()
+        self._index.close()
+
+    def _load_xor_key(self):
+        # Bitcoin Core 28 and later may obfuscate block files with the key in xor.dat
+        try:
+            with open(os.path.join(self.blocks_dir, 'xor.dat'), 'rb') as file:
+                key = file.read()
+        except FileNotFoundError:
+            return None
+        return key if any(key) else None
+
+    def block_files(self):
+        # Returns (file number, path) pairs in file order
+        files = []
+        for name in os.listdir(self.blocks_dir):
+            match = _BLOCK_FILE_PATTERN.match(name)
+            if match:
+                files.append((int(match.group(1)), os.path.join(self.blocks_dir, name)))
+        return sorted(files)
+
+    def _map(self, file_number):
+        file_map = self._maps.get(file_number)
+        if file_map is None:
+            path = os.path.join(self.blocks_dir, f'blk{file_number:05d}.dat')
+            with open(path, 'rb') as file:
+                file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[file_number] = file_map
+        return file_map
+
+    def _read(self, file_number, start, end):
+        # Zero-copy slice of the mapping, or a de-obfuscated copy when xor.dat is in use
+        data = memoryview(self._map(file_number))[start:end]
+        if self._xor_key is None:
+            return data
+        key_length = len(self._xor_key)
+        shift = start % key_length
+        repeats = (end - start + shift) // key_length + 1
+        keystream = (self._xor_key * repeats)[shift:shift + end - start]
+        value = int.from_bytes(data, 'little') ^ int.from_bytes(keystream, 'little')
+        return memoryview(value.to_bytes(end - start, 'little'))
+
+    def _iter_records(self, file_number, position=0):
+        # Yields (data offset, length) for every block record framed by magic and length.
+        # Core preallocates block files, so zero padding marks the end of the data.
+        file_size = len(self._map(file_number))
+        while position + 8 <= file_size:
+            header = self._read(file_number, position, position + 8)
+            if header[:4] != self.magic:
+                return
+            length = int.from_bytes(header[4:8], 'little')
+            data_offset = position + 8
+            if data_offset + length > file_size:
+                return
+            yield data_offset, length
+            position = data_offset + length
+
+    def _read_header_hashes(self, file_number, data_offset):
+        header = self._read(file_number, data_offset, data_offset + 80)
+        return ord.block_hash_from_header(header), ord.previous_block_hash_from_header(header)
+
+    def build_index(self):
+        # Records the location of every block in the sidecar index, resuming after
+        # the data scanned by previous runs, and then assigns heights along the best chain
+        scanned = dict(self._index.execute('SELECT file_number, scanned_length FROM files'))
+        for file_number, path in self.block_files():
+            rows = []
+            end = scanned.get(file_number, 0)
+            if os.path.getsize(path) == 0:
+                continue
+            for data_offset, length in self._iter_records(file_number, end):
+                block_hash, prev_hash = self._read_header_hashes(file_number, data_offset)
+                rows.append((block_hash, prev_hash, file_number, data_offset, length))
+                end = data_offset + length
+            with self._index:
+                self._index.executemany('INSERT OR IGNORE INTO blocks (hash, prev_hash, file_number, data_offset, length) '
+                                        'VALUES (?, ?, ?, ?, ?)', rows)
+                self._index.execute('INSERT OR REPLACE INTO files (file_number, scanned_length) VALUES (?, ?)',
+                                    (file_number, end))
+            # Release the mapping, the file is not needed again until blocks are read
+            self._maps.pop(file_number).close()
+        self._assign_heights()
+
+    def _assign_heights(self):
+        # Walks the block tree from genesis and marks the longest chain with heights.
+        # Stale blocks keep a NULL height.
+        children = {}
+        for block_hash, prev_hash in self._index.execute('SELECT hash, prev_hash FROM blocks'):
+            children.setdefault(prev_hash, []).append(block_hash)
+
+        genesis_parent = '00' * 32
+        depth = {}
+        parent = {}
+        stack = [(block_hash, 0) for block_hash in children.get(genesis_parent, [])]
+        tip, tip_height = None, -1
+        while stack:
+            block_hash, height = stack.pop()
+            depth[block_hash] = height
+            if height > tip_height:
+                tip, tip_height = block_hash, height
+            for child in children.get(block_hash, []):
+                parent[child] = block_hash
+                stack.append((child, height + 1))
+
+        heights = []
+        while tip is not None:
+            heights.append((depth[tip], tip))
+            tip = parent.get(tip)
+        with self._index:
+            self._index.execute('UPDATE blocks SET height = NULL')
+            self._index.executemany('UPDATE blocks SET height = ? WHERE hash = ?', heights)
+
+    def iter_blocks(self, start_height, end_height):
+        # Yields (height, block hash, raw block) for the best-chain blocks in the
+        # inclusive height range. Raw blocks are memoryviews into the mapped files.
+        rows = self._index.execute('SELECT height, hash, file_number, data_offset, length FROM blocks '
+                                   'WHERE height BETWEEN ? AND ? ORDER BY height', (start_height, end_height))
+        for height, block_hash, file_number, data_offset, length in rows:
+            yield height, block_hash, self._read(file_number, data_offset, data_offset + length)
+
+    def iter_inscriptions(self, start_height, end_height):
+        # Yields (height, txid, input index, Inscription) for every envelope in the range
+        for height, _, raw_block in self.iter_blocks(start_height, end_height):
+            for tx_id, input_index, inscription in ord.iter_block_inscriptions(raw_block):
+                yield height, tx_id, input_index, inscription
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan Bitcoin Core block files for inscriptions without using RPC.")
+    parser.add_argument('start_height', type=int)
+    parser.add_argument('end_height', type=int)
+    parser.add_argument('--blocks-dir', default=LOCAL_NODE_BLOCKS_DIR, help="Bitcoin Core blocks directory")
+    parser.add_argument('--index', default=DEFAULT_INDEX_FILE, help="Path of the sidecar block index")
+    parser.add_argument('--network', default='main', choices=sorted(NETWORK_MAGIC))
+    args = parser.parse_args()
+
+    with BlockFileScanner(args.blocks_dir, args.index, args.network) as scanner:
+        print("Indexing block files...")
+        scanner.build_index()
+        for height, tx_id, input_index, inscription in scanner.iter_inscriptions(args.start_height, args.end_height):
+            print(f"{height} {tx_id} input {input_index}: {inscription.mime_type} ({inscription.size} bytes)")
+
+if __name__ == "__main__":
+    sys.exit(main())
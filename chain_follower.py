@@ -0,0 +1,150 @@
+import sys
+import json
+import time
+import argparse
+import ordinals_parser as ord
+from inscription_index import InscriptionIndex, DEFAULT_INDEX_FILE
+
+# Where the follower remembers the blocks it has processed
+DEFAULT_CHECKPOINT_FILE = 'chain_follower_checkpoint.json'
+
+# Number of processed blocks kept in the checkpoint. Reorgs up to this depth are
+# rolled back to the exact fork point.
+CHECKPOINT_DEPTH = 100
+
+# Seconds between two polls of the chain tip
+POLL_INTERVAL = 30
+
+class ChainFollower(object):
+    # Processes every new block on the best chain exactly once. The tip height is
+    # polled through the client (Mempool blocks/tip/height or getblockchaininfo),
+    # blocks between the last processed block and the tip are handed to
+    # on_block(height, block hash, raw block), and the processed blocks are
+    # checkpointed after each one.
+    #
+    # Before catching up, and whenever a new block does not build on the last
+    # processed one, processed blocks that are no longer on the best chain are
+    # passed to on_rollback(height, block hash), newest first, until the fork point
+    # is reached. Processing then continues from the fork point.
+    #
+    # client can be anything with get_tip_height(timeout), get_block_hash(height,
+    # timeout) and get_raw_block(block hash, timeout), e.g. a stand-in node in tests.
+    def __init__(self, on_block, on_rollback=None, checkpoint_path=DEFAULT_CHECKPOINT_FILE,
+                 start_height=None, client=None, timeout_duration=10):
+        self.on_block = on_block
+        self.on_rollback = on_rollback
+        self.checkpoint_path = checkpoint_path
+        self.start_height = start_height
+        self.client = client or ord.get_client()
+        self.timeout_duration = timeout_duration
+        self.blocks = self._load_checkpoint()  # [height, block hash] pairs in chain order
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as file:
+                return json.load(file)['blocks']
+        except FileNotFoundError:
+            return []
+
+    def _save_checkpoint(self):
+        del self.blocks[:-CHECKPOINT_DEPTH]
+        data = json.dumps({'blocks': self.blocks}).encode()
+        ord.write_chunks_atomically([data], self.checkpoint_path)
+
+    @property
+    def height(self):
+        # Height of the last processed block, or None before the first block
+        return self.blocks[-1][0] if self.blocks else None
+
+    def _next_height(self):
+        return self.blocks[-1][0] + 1 if self.blocks else self.start_height
+
+    def rollback(self, tip_height):
+        # Disconnects processed blocks that left the best chain, including blocks above
+        # the tip when the chain was reorganized to a shorter one. Returns the number of
+        # blocks rolled back, or None if the node could not be asked.
+        rolled_back = 0
+        while self.blocks:
+            height, block_hash = self.blocks[-1]
+            if height <= tip_height:
+                best_hash = self.client.get_block_hash(height, self.timeout_duration)
+                if best_hash is None:
+                    return None
+                if best_hash == block_hash:
+                    break
+            if self.on_rollback is not None:
+                self.on_rollback(height, block_hash)
+            self.blocks.pop()
+            rolled_back += 1
+            if not self.blocks:
+                # The fork point is older than the checkpoint, start over from the
+                # oldest block we know was replaced
+                print(f"Reorg deeper than {CHECKPOINT_DEPTH} blocks, reprocessing from height {height}.")
+                self.start_height = height
+            self._save_checkpoint()
+        return rolled_back
+
+    def poll(self):
+        # Processes the blocks up to the current tip. Returns the number of blocks processed.
+        tip_height = self.client.get_tip_height(self.timeout_duration)
+        if tip_height is None:
+            return 0
+        if self.start_height is None and not self.blocks:
+            # Nothing processed yet and no start given, follow from the current tip
+            self.start_height = tip_height
+        if self.rollback(tip_height) is None:
+            return 0
+
+        processed = 0
+        height = self._next_height()
+        while height <= tip_height:
+            block_hash = self.client.get_block_hash(height, self.timeout_duration)
+            raw_block = self.client.get_raw_block(block_hash, self.timeout_duration) if block_hash else None
+            if raw_block is None:
+                print(f"Could not retrieve block {height}, retrying on the next poll.")
+                break
+            if self.blocks and ord.previous_block_hash_from_header(raw_block) != self.blocks[-1][1]:
+                # The chain was reorganized while catching up
+                if not self.rollback(tip_height):
+                    break
+                height = self._next_height()
+                continue
+            self.on_block(height, block_hash, raw_block)
+            self.blocks.append([height, block_hash])
+            self._save_checkpoint()
+            processed += 1
+            height += 1
+        return processed
+
+    def follow(self, poll_interval=POLL_INTERVAL):
+        # Polls the tip forever
+        while True:
+            self.poll()
+            time.sleep(poll_interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow the chain tip and index the inscriptions of every new block.")
+    parser.add_argument('--start-height', type=int, help="First block to process when there is no checkpoint (default: the current tip)")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT_FILE, help="Path of the checkpoint file")
+    parser.add_argument('--index', default=DEFAULT_INDEX_FILE, help="Path of the inscription database")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL, help="Seconds between two polls")
+    parser.add_argument('--once', action='store_true', help="Catch up to the current tip and exit")
+    args = parser.parse_args()
+
+    with InscriptionIndex(args.index) as index:
+        def on_block(height, block_hash, raw_block):
+            added = index.index_blocks([(height, block_hash, raw_block)])
+            print(f"Block {height} {block_hash}: {added} inscriptions")
+
+        def on_rollback(height, block_hash):
+            index.remove_block(height)
+            print(f"Block {height} {block_hash} was reorganized out, its inscriptions were removed")
+
+        follower = ChainFollower(on_block, on_rollback, args.checkpoint, args.start_height)
+        if args.once:
+            follower.poll()
+        else:
+            follower.follow(args.interval)
+
+if __name__ == "__main__":
+    sys.exit(main())
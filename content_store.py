@@ -0,0 +1,106 @@
+import os
+import hashlib
+import secrets
+import ordinals_parser as ord
+
+# Directory extracted inscriptions are stored in
+DEFAULT_STORE_DIR = 'inscriptions'
+
+class ContentStore(object):
+    # Stores every distinct inscription body once, keyed by the SHA-256 of the
+    # decoded body, and gives each inscription a readable name linked to it:
+    #
+    #   objects/ab/cd/abcd...      one file per distinct decoded body
+    #   encoded/ab/cd/abcd...-gzip the same file, keyed by the hash of the still
+    #                              encoded body and its content encoding
+    #   by-id/<name>.<ext>         hardlink (or symlink) to the body of one inscription
+    #
+    # Before anything is decoded or written the store checks, from cheapest to most
+    # expensive, whether the name already exists and whether the body (or its encoded
+    # form) is already stored. Only new content is decoded and written.
+    def __init__(self, root=DEFAULT_STORE_DIR, use_symlinks=False):
+        self.root = root
+        self.use_symlinks = use_symlinks
+
+    def _sharded_path(self, directory, key):
+        return os.path.join(self.root, directory, key[:2], key[2:4], key)
+
+    def object_path(self, content_hash):
+        return self._sharded_path('objects', content_hash)
+
+    def name_path(self, name, mime_type):
+        return os.path.join(self.root, 'by-id', f"{name}.{ord.mime_type_to_extension(mime_type)}")
+
+    def contains(self, content_hash):
+        return os.path.exists(self.object_path(content_hash))
+
+    def _link(self, source, link_path):
+        # Atomically points link_path at source, replacing a previous link.
+        # Hardlinks fall back to symlinks where the file system does not support them.
+        os.makedirs(os.path.dirname(link_path), exist_ok=True)
+        temp_path = f"{link_path}.{secrets.token_hex(4)}.tmp"
+        if not self.use_symlinks:
+            try:
+                os.link(source, temp_path)
+                os.replace(temp_path, link_path)
+                return
+            except OSError:
+                pass
+        os.symlink(os.path.relpath(os.path.realpath(source), os.path.dirname(link_path)), temp_path)
+        os.replace(temp_path, link_path)
+
+    def _write_object(self, chunks):
+        # Streams chunks into the store while hashing them and returns the object path
+        content_hash = hashlib.sha256()
+
+        def hashed_chunks():
+            for chunk in chunks:
+                content_hash.update(chunk)
+                yield chunk
+
+        incoming_dir = os.path.join(self.root, 'objects')
+        os.makedirs(incoming_dir, exist_ok=True)
+        incoming_path = os.path.join(incoming_dir, f"incoming.{secrets.token_hex(8)}")
+        ord.write_chunks_atomically(hashed_chunks(), incoming_path)
+
+        object_path = self.object_path(content_hash.hexdigest())
+        if os.path.exists(object_path):
+            # A different encoding of content that is already stored
+            os.unlink(incoming_path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(incoming_path, object_path)
+        return object_path
+
+    def put_inscription(self, inscription, name, decode_content=True):
+        # Stores the inscription body under name (e.g. "<txid>i0") and returns the path
+        # of the name, which ends with the extension of the inscription's MIME type
+        name_path = self.name_path(name, inscription.mime_type)
+        if os.path.exists(name_path):
+            return name_path
+
+        raw_hash = hashlib.sha256()
+        for chunk in inscription.iter_chunks():
+            raw_hash.update(chunk)
+        encoding = inscription.content_encoding if decode_content else None
+
+        if encoding is not None:
+            encoded_path = self._sharded_path('encoded', f"{raw_hash.hexdigest()}-{encoding.strip().lower()}")
+            if os.path.exists(encoded_path):
+                object_path = encoded_path
+            else:
+                try:
+                    object_path = self._write_object(inscription.iter_decoded_chunks())
+                except Exception as e:  # Unsupported, corrupt or oversized encoded bodies
+                    print(f"Could not decode {name}, storing the encoded body: {e}")
+                    encoding = None
+                else:
+                    self._link(object_path, encoded_path)
+        if encoding is None:
+            # The stored body is the raw body, the hash is already known
+            object_path = self.object_path(raw_hash.hexdigest())
+            if not os.path.exists(object_path):
+                object_path = self._write_object(inscription.iter_chunks())
+
+        self._link(object_path, name_path)
+        return name_path
@@ -0,0 +1,209 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+import metrics
+
+# Number of recent requests per endpoint the latency and error rate are computed from
+STATS_WINDOW = 100
+
+# A hedged request goes to the next endpoint once a request has been running for
+# this percentile of the endpoint's recent latencies
+HEDGE_PERCENTILE = 0.95
+
+# Recent latencies needed before the percentile is trusted, until then the hedge
+# is sent after DEFAULT_HEDGE_FRACTION of the timeout
+MIN_HEDGE_SAMPLES = 10
+DEFAULT_HEDGE_FRACTION = 0.5
+
+# Lower bound of the hedge delay in seconds, so fast endpoints do not get every request twice
+MIN_HEDGE_DELAY = 0.05
+
+# Consecutive failures after which an endpoint is skipped, and for how long (doubling
+# up to the maximum while it keeps failing its trial requests)
+CIRCUIT_BREAKER_FAILURES = 5
+CIRCUIT_BREAKER_COOLDOWN = 30
+CIRCUIT_BREAKER_MAX_COOLDOWN = 600
+
+# Returned by an attempt the endpoint answered with 429 Too Many Requests
+THROTTLED = object()
+
+class EndpointStats(object):
+    __slots__ = ('latencies', 'outcomes', 'consecutive_failures', 'open_until', 'cooldown')
+
+    def __init__(self):
+        self.latencies = deque(maxlen=STATS_WINDOW)
+        self.outcomes = deque(maxlen=STATS_WINDOW)  # True for requests the endpoint answered
+        self.consecutive_failures = 0
+        self.open_until = 0
+        self.cooldown = CIRCUIT_BREAKER_COOLDOWN
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)]
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+class EndpointManager(object):
+    # Picks the endpoint for each public API request and hedges slow requests.
+    # Endpoints are ordered by their recent median latency plus error rate times the
+    # timeout (the expected cost of a request), so the configured primary is only
+    # preferred while it performs. When a request is still running after the
+    # endpoint's HEDGE_PERCENTILE latency, the same request is sent to the next
+    # endpoint and whichever answers first wins. Failed requests move on to the
+    # next endpoint right away. Endpoints failing CIRCUIT_BREAKER_FAILURES times in
+    # a row are skipped until their cooldown ends.
+    def __init__(self, endpoints, pool_size):
+        self.endpoints = list(endpoints)
+        self._stats = {endpoint: EndpointStats() for endpoint in self.endpoints}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size * max(len(self.endpoints), 1),
+                                            thread_name_prefix='endpoint')
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        # Snapshot of every endpoint's rolling statistics, latencies in seconds
+        with self._lock:
+            return {endpoint: {'p50': stats.percentile(0.5), 'p95': stats.percentile(0.95),
+                               'p99': stats.percentile(0.99), 'error_rate': stats.error_rate,
+                               'circuit_open': stats.open_until > time.monotonic()}
+                    for endpoint, stats in self._stats.items()}
+
+    def _record(self, endpoint, latency, answered):
+        with self._lock:
+            stats = self._stats[endpoint]
+            stats.outcomes.append(answered)
+            if answered:
+                stats.latencies.append(latency)
+                stats.consecutive_failures = 0
+                stats.open_until = 0
+                stats.cooldown = CIRCUIT_BREAKER_COOLDOWN
+                return
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= CIRCUIT_BREAKER_FAILURES:
+                stats.open_until = time.monotonic() + stats.cooldown
+                stats.cooldown = min(stats.cooldown * 2, CIRCUIT_BREAKER_MAX_COOLDOWN)
+
+    def candidates(self, timeout_duration):
+        # Endpoints to try in order. If every circuit is open, the endpoint whose
+        # cooldown ends first gets a trial request rather than failing outright.
+        now = time.monotonic()
+        with self._lock:
+            closed = [endpoint for endpoint in self.endpoints if self._stats[endpoint].open_until <= now]
+            if not closed:
+                return [min(self.endpoints, key=lambda endpoint: self._stats[endpoint].open_until)]
+
+            def expected_cost(endpoint):
+                stats = self._stats[endpoint]
+                return (stats.percentile(0.5) or 0) + stats.error_rate * timeout_duration
+            return sorted(closed, key=expected_cost)
+
+    def hedge_delay(self, endpoint, timeout_duration):
+        with self._lock:
+            stats = self._stats[endpoint]
+            if len(stats.latencies) < MIN_HEDGE_SAMPLES:
+                return timeout_duration * DEFAULT_HEDGE_FRACTION
+            return min(max(stats.percentile(HEDGE_PERCENTILE), MIN_HEDGE_DELAY), timeout_duration)
+
+    def _attempt(self, endpoint, send):
+        # Returns the response, THROTTLED for a 429, or None if the request failed.
+        # 4xx responses (including 429) mean the endpoint is up but cannot serve this
+        # request, they do not count against its error rate.
+        start = time.monotonic()
+        try:
+            response = send(endpoint)
+        except requests.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else 500
+            self._record(endpoint, time.monotonic() - start, status_code < 500)
+            metrics.increment('endpoint_requests_total', endpoint=endpoint, outcome=f'http_{status_code}')
+            return THROTTLED if status_code == 429 else None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self._record(endpoint, time.monotonic() - start, False)
+            metrics.increment('endpoint_requests_total', endpoint=endpoint, outcome=type(e).__name__.lower())
+            return None
+        self._record(endpoint, time.monotonic() - start, True)
+        metrics.increment('endpoint_requests_total', endpoint=endpoint, outcome='ok')
+        return response
+
+    def request(self, send, timeout_duration, acquire=None):
+        # Calls send(endpoint), which returns a response or raises a requests error,
+        # on the best endpoint and hedges or falls back to the others. Returns the
+        # first successful response, or None if all endpoints failed.
+        #
+        # acquire(endpoint, wait) waits for the endpoint's rate limit and returns
+        # whether the request may be sent. It is called before the request is handed
+        # to a worker, so time spent queueing neither counts as endpoint latency nor
+        # runs down the hedge delay. Hedges are only sent to endpoints that have a
+        # token right away (wait=False), a hedge that has to queue would not be faster.
+        candidates = self.candidates(timeout_duration)
+        running = {}
+        started = 0
+        failures = 0
+        throttled = 0
+        hedging = True
+
+        def start(wait_for_turn):
+            nonlocal started
+            endpoint = candidates[started]
+            if acquire is not None and not acquire(endpoint, wait_for_turn):
+                metrics.increment('endpoint_requests_total', endpoint=endpoint, outcome='rate_limited')
+                return False
+            started += 1
+            running[self._executor.submit(self._attempt, endpoint, send)] = endpoint
+            return True
+
+        def start_next():
+            # Starts the first remaining endpoint the rate limit lets through
+            nonlocal started
+            while started < len(candidates):
+                if start(True):
+                    return
+                started += 1
+
+        start_next()
+        while running:
+            hedge_delay = None
+            if hedging and started < len(candidates):
+                hedge_delay = self.hedge_delay(candidates[started - 1], timeout_duration)
+            done, _ = wait(running, timeout=hedge_delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # Still no answer after the hedge delay, ask the next endpoint as well
+                # if it can take the request now
+                endpoint = candidates[started]
+                if start(False):
+                    metrics.increment('hedged_requests_total', endpoint=endpoint)
+                else:
+                    hedging = False
+                continue
+            for future in done:
+                endpoint = running.pop(future)
+                response = future.result()
+                if response is THROTTLED:
+                    # Not a failure, the caller retries once the endpoint's pause is over
+                    throttled += 1
+                    continue
+                if response is not None:
+                    if running:
+                        # Answered while another endpoint was still working on the request
+                        metrics.increment('race_wins_total', endpoint=endpoint)
+                    return response
+                failures += 1
+                if failures == 1 and len(candidates) > 1:
+                    print("Primary public API failed. Attempting fallback public API.")
+            if not running and started < len(candidates):
+                metrics.increment('fallbacks_total', endpoint=candidates[started])
+                start_next()
+        if failures:
+            print("Fallback public API also failed.")
+        elif not throttled:
+            print("Public API rate limit reached, the request was not sent.")
+        return None
@@ -0,0 +1,24 @@
+import re
+import binascii
+
+_NON_HEX_PATTERN = re.compile(r'[^0-9a-fA-F]')
+
+def decode_hex(hex_string):
+    # Strict and fast hex decoding of a str or bytes-like object. Raises ValueError
+    # for odd lengths or characters that are not hex digits (including whitespace).
+    try:
+        return binascii.unhexlify(hex_string)
+    except (binascii.Error, TypeError) as e:
+        raise ValueError(f"Invalid hex string: {e}") from None
+
+def decode_hex_tolerant(hex_string):
+    # Removes every character that is not a hex digit before decoding, for pasted
+    # or otherwise untrusted input. Raises ValueError if an odd number of digits remain.
+    hex_string = _NON_HEX_PATTERN.sub('', hex_string)
+    if len(hex_string) % 2 != 0:
+        raise ValueError("Hex string length is odd. Cannot convert to binary.")
+    return binascii.unhexlify(hex_string)
+
+def encode_hex(data):
+    # Works on bytes, bytearray and memoryview without copying the data first
+    return memoryview(data).hex()
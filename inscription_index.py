@@ -0,0 +1,243 @@
+import sys
+import sqlite3
+import hashlib
+import argparse
+import ordinals_parser as ord
+
+# Name of the inscription database written to the working directory
+DEFAULT_INDEX_FILE = 'inscriptions.sqlite'
+
+# Number of inscription rows written per transaction
+INSERT_BATCH_SIZE = 5000
+
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inscriptions (
+    txid TEXT NOT NULL,
+    input_index INTEGER NOT NULL,
+    witness_index INTEGER NOT NULL,
+    envelope_offset INTEGER NOT NULL,
+    block_height INTEGER NOT NULL,
+    block_hash TEXT NOT NULL,
+    mime_type TEXT,
+    extension TEXT NOT NULL,
+    body_size INTEGER NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (txid, input_index, witness_index, envelope_offset)
+);
+CREATE INDEX IF NOT EXISTS inscriptions_extension_height ON inscriptions (extension, block_height);
+CREATE INDEX IF NOT EXISTS inscriptions_mime_type_height ON inscriptions (mime_type, block_height);
+CREATE INDEX IF NOT EXISTS inscriptions_height ON inscriptions (block_height);
+CREATE INDEX IF NOT EXISTS inscriptions_size ON inscriptions (body_size);
+CREATE INDEX IF NOT EXISTS inscriptions_content_hash ON inscriptions (content_hash);
+CREATE TABLE IF NOT EXISTS blocks (
+    height INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+"""
+
+_COLUMNS = ('txid, input_index, witness_index, envelope_offset, block_height, block_hash, '
+            'mime_type, extension, body_size, chunk_count, content_hash')
+
+def normalize_mime_type(mime_type):
+    # 'Text/Plain; charset=UTF-8' and 'text/plain;charset=utf-8' are the same type
+    if mime_type is None:
+        return None
+    return mime_type.strip().lower().replace(' ', '')
+
+class IndexedInscription(object):
+    __slots__ = ('txid', 'input_index', 'witness_index', 'envelope_offset', 'block_height', 'block_hash',
+                 'mime_type', 'extension', 'body_size', 'chunk_count', 'content_hash')
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return (f"IndexedInscription(txid={self.txid!r}, input_index={self.input_index}, "
+                f"block_height={self.block_height}, mime_type={self.mime_type!r}, body_size={self.body_size})")
+
+def _content_hash(inscription):
+    # SHA-256 of the body with its content encoding removed, the key ContentStore
+    # stores it under. Bodies that cannot be decoded are hashed as they are.
+    content_hash = hashlib.sha256()
+    try:
+        for chunk in inscription.iter_decoded_chunks():
+            content_hash.update(chunk)
+    except Exception:  # Unsupported, corrupt or oversized encoded bodies
+        content_hash = hashlib.sha256()
+        for chunk in inscription.iter_chunks():
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+def _inscription_row(tx_id, inscription, block_height, block_hash):
+    mime_type = normalize_mime_type(inscription.mime_type)
+    return (tx_id, inscription.input_index, inscription.witness_index, inscription.offset, block_height, block_hash,
+            mime_type, ord.mime_type_to_extension(mime_type), inscription.size, len(inscription.chunks),
+            _content_hash(inscription))
+
+class InscriptionIndex(object):
+    # SQLite index of every inscription envelope found in a range of blocks, so
+    # inscriptions can be looked up by block, MIME type, size or content without
+    # fetching and parsing the blocks again. Blocks are recorded with their hash:
+    # indexing a block again is skipped, and a different block at an indexed height
+    # (after a reorg) replaces the inscriptions of the old one.
+    def __init__(self, path=DEFAULT_INDEX_FILE):
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_INDEX_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def indexed_block_hash(self, height):
+        row = self._db.execute('SELECT hash FROM blocks WHERE height = ?', (height,)).fetchone()
+        return row[0] if row is not None else None
+
+    def index_blocks(self, blocks, batch_size=INSERT_BATCH_SIZE):
+        # Indexes (height, block hash, raw block) triples, e.g. from BlockFileScanner.iter_blocks.
+        # The block hash may be None, it is then computed from the header.
+        # Returns the number of inscriptions added.
+        rows, indexed_blocks = [], []
+        added = 0
+        for height, block_hash, raw_block in blocks:
+            if block_hash is None:
+                block_hash = ord.block_hash_from_header(raw_block)
+            if self.indexed_block_hash(height) == block_hash:
+                continue
+            for tx_id, _, inscription in ord.iter_block_inscriptions(raw_block):
+                rows.append(_inscription_row(tx_id, inscription, height, block_hash))
+            indexed_blocks.append((height, block_hash))
+            if len(rows) >= batch_size:
+                added += self._write(rows, indexed_blocks)
+                rows, indexed_blocks = [], []
+        if indexed_blocks:
+            added += self._write(rows, indexed_blocks)
+        return added
+
+    def _write(self, rows, indexed_blocks):
+        with self._db:
+            self._db.executemany('DELETE FROM inscriptions WHERE block_height = ?',
+                                 [(height,) for height, _ in indexed_blocks])
+            self._db.executemany(f'INSERT OR REPLACE INTO inscriptions ({_COLUMNS}) '
+                                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._db.executemany('INSERT OR REPLACE INTO blocks (height, hash) VALUES (?, ?)', indexed_blocks)
+        return len(rows)
+
+    def remove_block(self, height):
+        # Removes a block and its inscriptions, e.g. when it was disconnected by a reorg
+        with self._db:
+            self._db.execute('DELETE FROM inscriptions WHERE block_height = ?', (height,))
+            self._db.execute('DELETE FROM blocks WHERE height = ?', (height,))
+
+    def index_range(self, start_height, end_height, client=None, timeout_duration=10):
+        # Downloads and indexes the blocks in the inclusive height range through the
+        # public API or the local node. Returns the number of inscriptions added.
+        client = client or ord.get_client()
+
+        def blocks():
+            for height in range(start_height, end_height + 1):
+                block_hash = client.get_block_hash(height, timeout_duration)
+                if block_hash is None or self.indexed_block_hash(height) == block_hash:
+                    continue
+                raw_block = client.get_raw_block(block_hash, timeout_duration)
+                if raw_block is None:
+                    print(f"Could not retrieve block {height}, skipping it.")
+                    continue
+                yield height, block_hash, raw_block
+        return self.index_blocks(blocks())
+
+    def _query(self, conditions, params, limit=None):
+        query = f'SELECT {_COLUMNS} FROM inscriptions'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY block_height, txid, input_index, witness_index, envelope_offset'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        return [IndexedInscription(*row) for row in self._db.execute(query, params)]
+
+    def find(self, mime_type=None, extension=None, start_height=None, end_height=None,
+             min_size=None, max_size=None, limit=None):
+        # Returns the inscriptions matching every given filter, in chain order.
+        # A mime_type is normalized through mime_type_to_extension, so 'text/plain'
+        # also finds 'text/plain;charset=utf-8'. Types without a known extension
+        # are matched exactly.
+        conditions, params = [], []
+        if mime_type is not None:
+            mime_type = normalize_mime_type(mime_type)
+            if ord.mime_type_to_extension(mime_type) != 'bin':
+                extension = ord.mime_type_to_extension(mime_type)
+            else:
+                conditions.append('mime_type = ?')
+                params.append(mime_type)
+        if extension is not None:
+            conditions.append('extension = ?')
+            params.append(extension)
+        if start_height is not None:
+            conditions.append('block_height >= ?')
+            params.append(start_height)
+        if end_height is not None:
+            conditions.append('block_height <= ?')
+            params.append(end_height)
+        if min_size is not None:
+            conditions.append('body_size >= ?')
+            params.append(min_size)
+        if max_size is not None:
+            conditions.append('body_size <= ?')
+            params.append(max_size)
+        return self._query(conditions, params, limit)
+
+    def get(self, tx_id):
+        # Returns every inscription revealed by the transaction
+        return self._query(['txid = ?'], [tx_id])
+
+    def with_content_hash(self, content_hash):
+        # Returns every inscription whose decoded body has the given SHA-256 hash,
+        # the hash in ContentStore's object paths
+        return self._query(['content_hash = ?'], [content_hash])
+
+def main():
+    parser = argparse.ArgumentParser(description="Index inscriptions in SQLite and look them up by block, MIME type and size.")
+    parser.add_argument('--index', default=DEFAULT_INDEX_FILE, help="Path of the inscription database")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = commands.add_parser('index', help="Index the inscriptions in a range of blocks")
+    index_parser.add_argument('start_height', type=int)
+    index_parser.add_argument('end_height', type=int)
+    index_parser.add_argument('--blocks-dir', help="Read blocks from Bitcoin Core's blk*.dat files instead of the API or RPC")
+
+    find_parser = commands.add_parser('find', help="List indexed inscriptions")
+    find_parser.add_argument('--mime-type')
+    find_parser.add_argument('--start-height', type=int)
+    find_parser.add_argument('--end-height', type=int)
+    find_parser.add_argument('--min-size', type=int)
+    find_parser.add_argument('--max-size', type=int)
+    find_parser.add_argument('--limit', type=int)
+    args = parser.parse_args()
+
+    with InscriptionIndex(args.index) as index:
+        if args.command == 'index':
+            if args.blocks_dir:
+                from blk_scanner import BlockFileScanner
+                with BlockFileScanner(args.blocks_dir) as scanner:
+                    scanner.build_index()
+                    added = index.index_blocks(scanner.iter_blocks(args.start_height, args.end_height))
+            else:
+                added = index.index_range(args.start_height, args.end_height)
+            print(f"Indexed {added} inscriptions.")
+        else:
+            for inscription in index.find(args.mime_type, None, args.start_height, args.end_height,
+                                          args.min_size, args.max_size, args.limit):
+                print(f"{inscription.block_height} {inscription.txid} input {inscription.input_index}: "
+                      f"{inscription.mime_type} ({inscription.body_size} bytes)")
+
+if __name__ == "__main__":
+    sys.exit(main())
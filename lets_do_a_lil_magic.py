@@ -7,6 +7,7 @@ import json
 import os
 import subprocess
 from pprint import pformat
+from content_store import ContentStore
 
 # Function to print like a typewriter
 def typewriter_print(text, delay=0.04):
@@ -201,7 +202,8 @@ loading_animation(1)
 print("")
 typewriter_print(f"Inscription data successfully extracted.")
 
-mime_type, inscription_data = ord.find_envelope_and_inscription(witness)
+inscription = ord.parse_envelope(ord.hex_to_bytes(witness))
+inscription_data = inscription.hex()
 
 time.sleep(1)
 print("")
@@ -225,16 +227,8 @@ print("")
 
 # Convert to file (the magic) 
 
-# Convert hex string to bytes
-binary_data = bytes(int(inscription_data[i:i+2], 16) for i in range(0, len(inscription_data), 2))
-
-# Determine the file extension
-extension = ord.mime_type_to_extension(mime_type)  # Ensure this function exists to determine the correct file extension
-output_file_with_extension = f"wizard.{extension}"
-
-# Save binary data to a file
-with open(output_file_with_extension, 'wb') as file:
-    file.write(binary_data)
+# Store the inscription by content, a wizard that was already summoned is not written again
+output_file_with_extension = ContentStore().put_inscription(inscription, f"{tx_id}i0")
 
 # Function to open the file with the default application
 def open_file(file_path):
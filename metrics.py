@@ -0,0 +1,170 @@
+import json
+import time
+import bisect
+import threading
+from node_config import ENABLE_METRICS
+
+# In-process counters and histograms fed by timing hooks in the fetch, parse,
+# decode, write and render stages. While disabled every hook returns right away,
+# timer() hands out one shared do-nothing context manager, so instrumented code
+# pays little more than a function call.
+#
+#   metrics.enable()
+#   with metrics.timer('stage_seconds', stage='parse'):
+#       ...
+#   metrics.increment('stage_bytes_total', len(data), stage='parse', direction='in')
+#   print(metrics.export_prometheus())
+
+enabled = ENABLE_METRICS
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'wizard_'
+
+# Upper bounds of the histogram buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_counters = {}
+_histograms = {}
+_lock = threading.Lock()
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+class Histogram(object):
+    __slots__ = ('bounds', 'bucket_counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.bucket_counts = [0] * (len(bounds) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_buckets(self):
+        # (upper bound, observations at or below it) pairs, ending with +Inf
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.bucket_counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def increment(name, value=1, **labels):
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, **labels):
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+class _Timer(object):
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timer(name, **labels):
+    # Context manager recording the duration of its block in the histogram name
+    if not enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+def snapshot():
+    # Returns every metric as plain data: {'counters': [...], 'histograms': [...]}
+    with _lock:
+        counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(_counters.items())]
+        histograms = [{'name': name, 'labels': dict(labels), 'count': histogram.count, 'sum': histogram.sum,
+                       'buckets': histogram.cumulative_buckets()}
+                      for (name, labels), histogram in sorted(_histograms.items())]
+    return {'counters': counters, 'histograms': histograms}
+
+def _format_labels(labels, extra=()):
+    items = list(labels.items()) + list(extra)
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+def export_prometheus():
+    # Prometheus text exposition format
+    data = snapshot()
+    lines = []
+    typed = set()
+    for counter in data['counters']:
+        name = METRIC_PREFIX + counter['name']
+        if name not in typed:
+            lines.append(f'# TYPE {name} counter')
+            typed.add(name)
+        lines.append(f"{name}{_format_labels(counter['labels'])} {counter['value']}")
+    for histogram in data['histograms']:
+        name = METRIC_PREFIX + histogram['name']
+        if name not in typed:
+            lines.append(f'# TYPE {name} histogram')
+            typed.add(name)
+        for bound, count in histogram['buckets']:
+            lines.append(f"{name}_bucket{_format_labels(histogram['labels'], [('le', _format_bound(bound))])} {count}")
+        lines.append(f"{name}_sum{_format_labels(histogram['labels'])} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(histogram['labels'])} {histogram['count']}")
+    return '\n'.join(lines) + '\n'
+
+def export_json_lines():
+    # One JSON object per metric, stamped with the export time, for appending to a log
+    data = snapshot()
+    timestamp = time.time()
+    lines = []
+    for counter in data['counters']:
+        lines.append(json.dumps({'timestamp': timestamp, 'type': 'counter', **counter}))
+    for histogram in data['histograms']:
+        histogram['buckets'] = [[_format_bound(bound), count] for bound, count in histogram['buckets']]
+        lines.append(json.dumps({'timestamp': timestamp, 'type': 'histogram', **histogram}))
+    return '\n'.join(lines) + '\n' if lines else ''
@@ -33,4 +33,39 @@ LOCAL_NODE_RPC_USER = 'LOCAL_NODE_RPC_USER'  # Replace with your RPC username
 
 # LOCAL_NODE_RPC_PASSWORD: Password for RPC authentication.
 # This should match the password in your Bitcoin node's bitcoin.conf.
-LOCAL_NODE_RPC_PASSWORD = 'LOCAL_NODE_RPC_PASSWORD'  # Replace with your RPC password
\ No newline at end of file
+LOCAL_NODE_RPC_PASSWORD = 'LOCAL_NODE_RPC_PASSWORD'  # Replace with your RPC password
+
+# LOCAL_NODE_BLOCKS_DIR: The blocks directory of your Bitcoin Core data directory.
+# Only used by blk_scanner.py, which reads the blk*.dat files directly instead of using RPC.
+# Default on Linux is '~/.bitcoin/blocks'.
+LOCAL_NODE_BLOCKS_DIR = '~/.bitcoin/blocks'  # Modify as needed
+
+# Configuration for Recorded Responses
+# ====================================
+# USE_RECORDED_STORE: If True, no network is used at all. Public API responses
+# (USE_PUBLIC_API = True) or node RPC responses (USE_PUBLIC_API = False) are served
+# from the recordings in RECORDED_STORE_PATH instead. Useful for working offline
+# and for load testing without sending requests to mempool.space.
+USE_RECORDED_STORE = False  # Set to True to replay recorded responses
+
+# RECORD_RESPONSES: If True (and USE_RECORDED_STORE is False), every successful
+# response from the public API or the local node is also saved to RECORDED_STORE_PATH.
+RECORD_RESPONSES = False  # Set to True to record responses for later replay
+
+# RECORDED_STORE_PATH: Where recorded responses are stored. A directory holds one
+# file per response, a path ending in '.jsonl' keeps all responses in a single file.
+RECORDED_STORE_PATH = 'recorded_responses'  # Modify as needed
+
+# SIMULATED_LATENCY and SIMULATED_ERROR_RATE: Only apply when replaying. Every replayed
+# request is delayed by SIMULATED_LATENCY seconds, and this fraction of them fails
+# with a connection error, so the fallback paths can be exercised offline.
+SIMULATED_LATENCY = 0  # Seconds, e.g. 0.2
+SIMULATED_ERROR_RATE = 0  # Between 0 and 1, e.g. 0.1
+
+# Configuration for Metrics
+# =========================
+# ENABLE_METRICS: If True, the fetch, parse, decode, write and render stages record
+# timings, byte counts, cache hits and fallbacks in memory. Read them with
+# metrics.snapshot() or export them with metrics.export_prometheus() and
+# metrics.export_json_lines(). Costs close to nothing while False.
+ENABLE_METRICS = False  # Set to True to collect metrics
@@ -1,119 +1,541 @@
+import os
+import re
+import zlib
+import hashlib
+import secrets
+import asyncio
+import time
+import threading
+import http.client
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import requests
-from bitcoin.rpc import RawProxy
+from requests.adapters import HTTPAdapter
+try:
+    import brotli
+except ImportError:  # Only needed for brotli encoded inscriptions
+    brotli = None
+from bitcoin.rpc import RawProxy, JSONRPCError
+from bitcoin.core.script import OPCODE_NAMES as _BITCOIN_OPCODE_NAMES, CScriptOp
+import metrics
+from hex_codec import decode_hex
+from endpoint_manager import EndpointManager
+from rate_limiter import MAX_QUEUE_WAIT, get_rate_limiter, parse_retry_after
+from recorded_backend import RecordedStore, ReplayAdapter, RecordingAdapter, ReplayProxy, RecordingProxy
 from node_config import (USE_PUBLIC_API, PUBLIC_API_ENDPOINT, FALLBACK_API_ENDPOINT,
-                    LOCAL_NODE_RPC_URL, LOCAL_NODE_RPC_USER, LOCAL_NODE_RPC_PASSWORD)
+                    LOCAL_NODE_RPC_URL, LOCAL_NODE_RPC_USER, LOCAL_NODE_RPC_PASSWORD,
+                    USE_RECORDED_STORE, RECORD_RESPONSES, RECORDED_STORE_PATH,
+                    SIMULATED_LATENCY, SIMULATED_ERROR_RATE)
+
+# Maximum number of confirmed transactions kept in memory by the transaction store
+TRANSACTION_CACHE_SIZE = 64
+
+# Number of transactions requested per JSON-RPC batch by get_transactions
+RPC_BATCH_SIZE = 100
+
+# Maximum number of keep-alive connections held open to each public API endpoint
+HTTP_POOL_SIZE = 10
+
+class TransactionStore(object):
+    # Memoizes fetched transactions in a bounded LRU and coalesces concurrent
+    # requests for the same txid, so every txid is downloaded once per process.
+    # Only results accepted by is_cacheable (confirmed txs, which are immutable)
+    # are kept after the fetch completes. name labels the store's cache metrics.
+    def __init__(self, fetch, is_cacheable, max_size=TRANSACTION_CACHE_SIZE, name='transactions'):
+        self.name = name
+        self._fetch = fetch
+        self._is_cacheable = is_cacheable
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get(self, tx_id, *args):
+        with self._lock:
+            if tx_id in self._cache:
+                self._cache.move_to_end(tx_id)
+                metrics.increment('cache_requests_total', cache=self.name, result='hit')
+                return self._cache[tx_id]
+            pending = self._in_flight.get(tx_id)
+            is_owner = pending is None
+            if is_owner:
+                pending = self._in_flight[tx_id] = Future()
+
+        # Another thread is already fetching this txid, wait for its result
+        if not is_owner:
+            metrics.increment('cache_requests_total', cache=self.name, result='coalesced')
+            return pending.result()
+        metrics.increment('cache_requests_total', cache=self.name, result='miss')
 
-def get_blockchain_info(timeout_duration=2):
-    if USE_PUBLIC_API:
-        print("Error: This function is only available when using a local node.")
-        return None
-    else:
-        # Use local node
-        service_url = f'http://{LOCAL_NODE_RPC_USER}:{LOCAL_NODE_RPC_PASSWORD}@{LOCAL_NODE_RPC_URL}'
-        p = RawProxy(service_url=service_url)
         try:
-            blockchain_info = p.getblockchaininfo()
-            return blockchain_info
-        except Exception as e:
-            print(f"Local node RPC error: {e}")
+            tx = self._fetch(tx_id, *args)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[tx_id]
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[tx_id]
+            if tx is not None and self._is_cacheable(tx):
+                self._insert(tx_id, tx)
+        pending.set_result(tx)
+        return tx
+
+    def get_cached(self, tx_id):
+        with self._lock:
+            if tx_id in self._cache:
+                self._cache.move_to_end(tx_id)
+                return self._cache[tx_id]
             return None
 
-def get_full_transaction_from_tx_id(tx_id, timeout_duration=2):
-    if USE_PUBLIC_API:
-        # Try primary public API
+    def put(self, tx_id, tx):
+        # Stores a transaction fetched outside the store, e.g. as part of a batch
+        if not self._is_cacheable(tx):
+            return
+        with self._lock:
+            self._insert(tx_id, tx)
+
+    def _insert(self, tx_id, tx):
+        # Callers must hold the lock
+        self._cache[tx_id] = tx
+        self._cache.move_to_end(tx_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+def is_confirmed(tx):
+    # Public API transactions carry a status object, node transactions a confirmation count
+    if 'status' in tx:
+        return tx['status'].get('confirmed', False)
+    return tx.get('confirmations', 0) > 0
+
+def witness_data_from_transaction(tx):
+    # Joined hex witness of the first input of a transaction in JSON form.
+    # The public API calls the witness 'witness', the node calls it 'txinwitness'.
+    vin = tx.get('vin', [{}])[0]
+    return ''.join(vin.get('witness', vin.get('txinwitness', [])))
+
+def _rpc_service_url(rpc_url, rpc_user, rpc_password):
+    # LOCAL_NODE_RPC_URL may or may not include the scheme
+    scheme, _, host = rpc_url.rpartition('://')
+    return f'{scheme or "http"}://{rpc_user}:{rpc_password}@{host}'
+
+class OrdinalsClient(object):
+    # Long-lived client holding a keep-alive session per public API endpoint and
+    # a single persistent RPC connection to the local node. One instance can be
+    # shared by all threads of the process.
+    def __init__(self, use_public_api=USE_PUBLIC_API,
+                 endpoints=(PUBLIC_API_ENDPOINT, FALLBACK_API_ENDPOINT),
+                 rpc_url=LOCAL_NODE_RPC_URL, rpc_user=LOCAL_NODE_RPC_USER,
+                 rpc_password=LOCAL_NODE_RPC_PASSWORD,
+                 pool_size=HTTP_POOL_SIZE, cache_size=TRANSACTION_CACHE_SIZE,
+                 use_recorded_store=USE_RECORDED_STORE, record_responses=RECORD_RESPONSES,
+                 recorded_store_path=RECORDED_STORE_PATH, simulated_latency=SIMULATED_LATENCY,
+                 simulated_error_rate=SIMULATED_ERROR_RATE, rate_limit=True):
+        self.use_public_api = use_public_api
+        # Without rate_limit requests skip the endpoints' rate limiters, for servers we run ourselves
+        self.rate_limit = rate_limit
+        self.endpoints = list(endpoints)
+        # Replaying serves every response from the recorded store, recording saves live responses to it
+        self.replay = use_recorded_store
+        self.recorded_store = None
+        if use_recorded_store or record_responses:
+            self.recorded_store = RecordedStore(recorded_store_path, simulated_latency, simulated_error_rate)
+        self._sessions = {endpoint: self._create_session(endpoint, pool_size) for endpoint in self.endpoints}
+        self.endpoint_manager = EndpointManager(self.endpoints, pool_size)
+        self._service_url = _rpc_service_url(rpc_url, rpc_user, rpc_password)
+        self._rpc_proxy = None
+        self._rpc_lock = threading.Lock()
+        self.transaction_store = TransactionStore(self._fetch_transaction, is_confirmed, cache_size, 'transactions')
+        # Raw transactions are checked against their txid when fetched, so they are always cacheable
+        self.raw_transaction_store = TransactionStore(self._fetch_raw_transaction, lambda raw_tx: True, cache_size,
+                                                      'raw_transactions')
+
+    def _create_session(self, endpoint, pool_size):
+        session = requests.Session()
+        if self.recorded_store is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        elif self.replay:
+            adapter = ReplayAdapter(self.recorded_store, endpoint)
+        else:
+            adapter = RecordingAdapter(self.recorded_store, endpoint, pool_connections=1, pool_maxsize=pool_size)
+        session.mount(endpoint, adapter)
+        return session
+
+    def _create_rpc_proxy(self):
+        if self.recorded_store is None:
+            return RawProxy(service_url=self._service_url)
+        if self.replay:
+            return ReplayProxy(self.recorded_store)
+        return RecordingProxy(RawProxy(service_url=self._service_url), self.recorded_store)
+
+    def close(self):
+        self.endpoint_manager.close()
+        for session in self._sessions.values():
+            session.close()
+        with self._rpc_lock:
+            if self._rpc_proxy is not None:
+                self._rpc_proxy.close()
+                self._rpc_proxy = None
+
+    def api_get(self, path, timeout_duration=2):
+        # Sends the request to the fastest healthy endpoint, hedging it to the next
+        # endpoint when it is slow (see EndpointManager). Requests are paced by the
+        # endpoint's process-wide rate limiter. Returns the first successful response,
+        # or None if all endpoints failed.
+        backend = 'replay' if self.replay else 'public_api'
+        # Replayed responses do not count against the endpoint's rate limit
+        rate_limited = self.rate_limit and not self.replay
+        deadline = time.monotonic() + MAX_QUEUE_WAIT
+        throttled = False
+
+        def acquire(endpoint, wait):
+            if not rate_limited:
+                return True
+            return get_rate_limiter(endpoint).acquire(max(deadline - time.monotonic(), 0) if wait else 0)
+
+        def send(endpoint):
+            nonlocal throttled
+            with metrics.timer('stage_seconds', stage='fetch', backend=backend, endpoint=endpoint):
+                response = self._sessions[endpoint].get(f"{endpoint}{path}", timeout=timeout_duration)
+            metrics.increment('stage_bytes_total', len(response.content), stage='fetch', direction='in',
+                              backend=backend, endpoint=endpoint)
+            if rate_limited:
+                if response.status_code == 429:
+                    metrics.increment('throttled_requests_total', endpoint=endpoint)
+                    # Pauses the endpoint, the next acquire waits until the pause is over
+                    get_rate_limiter(endpoint).throttled(parse_retry_after(response.headers.get('Retry-After')))
+                    throttled = True
+                else:
+                    get_rate_limiter(endpoint).succeeded()
+            response.raise_for_status()
+            return response
+
+        while True:
+            response = self.endpoint_manager.request(send, timeout_duration, acquire)
+            # Throttled by every endpoint: try again once a pause is over, if that is
+            # within the queueing deadline (acquire refuses otherwise)
+            if response is not None or not throttled:
+                return response
+            if time.monotonic() >= deadline:
+                print("Public API rate limit reached, giving up on the request.")
+                return None
+            throttled = False
+
+    def api_get_json(self, path, timeout_duration=2):
+        response = self.api_get(path, timeout_duration)
+        if response is None:
+            return None
         try:
-            primary_url = f"{PUBLIC_API_ENDPOINT}tx/{tx_id}"
-            primary_response = requests.get(primary_url, timeout=timeout_duration)
-            primary_response.raise_for_status()
-            return primary_response.json()
-        except (requests.HTTPError, requests.ConnectionError, requests.Timeout):
-            print("Primary public API failed. Attempting fallback public API.")
-            # Try fallback public API
+            return response.json()
+        except ValueError:
+            print(f"Public API returned invalid JSON for {path}.")
+            return None
+
+    def _call_rpc_proxy(self, call):
+        # The RPC connection is kept open between calls. The lock serialises access
+        # because one HTTP connection can only carry one request at a time.
+        with self._rpc_lock:
+            if self._rpc_proxy is None:
+                self._rpc_proxy = self._create_rpc_proxy()
             try:
-                fallback_url = f"{FALLBACK_API_ENDPOINT}tx/{tx_id}"
-                fallback_response = requests.get(fallback_url, timeout=timeout_duration)
-                fallback_response.raise_for_status()
-                return fallback_response.json()
-            except (requests.HTTPError, requests.ConnectionError, requests.Timeout):
-                print("Fallback public API also failed.")
-                return None
-    else:
-        # Use local node
-        service_url = f'http://{LOCAL_NODE_RPC_USER}:{LOCAL_NODE_RPC_PASSWORD}@{LOCAL_NODE_RPC_URL}'
-        p = RawProxy(service_url=service_url)
+                return call(self._rpc_proxy)
+            except (http.client.HTTPException, ConnectionError):
+                if self.replay:
+                    # Simulated failure, retrying would square SIMULATED_ERROR_RATE
+                    raise
+                # The node closed the keep-alive connection, reconnect once
+                self._rpc_proxy.close()
+                self._rpc_proxy = self._create_rpc_proxy()
+                return call(self._rpc_proxy)
+
+    def rpc(self, method, *params):
+        with metrics.timer('stage_seconds', stage='fetch', backend=self._rpc_backend, endpoint='node'):
+            return self._call_rpc_proxy(lambda proxy: proxy._call(method, *params))
+
+    @property
+    def _rpc_backend(self):
+        return 'replay' if self.replay else 'rpc'
+
+    def rpc_batch(self, calls):
+        # Sends a list of (method, params) pairs as one JSON-RPC batch request.
+        # Returns (result, error) pairs in the order of calls, error being a
+        # JSONRPCError for calls the node rejected.
+        requests_batch = [{'version': '1.1', 'method': method, 'params': list(params), 'id': index}
+                          for index, (method, params) in enumerate(calls)]
+        with metrics.timer('stage_seconds', stage='fetch', backend=self._rpc_backend, endpoint='node'):
+            responses = self._call_rpc_proxy(lambda proxy: proxy._batch(requests_batch))
+        if isinstance(responses, dict):
+            # The node rejected the batch as a whole
+            error = JSONRPCError(responses.get('error') or {'code': -343, 'message': 'invalid batch response'})
+            return [(None, error)] * len(calls)
+
+        # Batch responses may come back in any order
+        results = [(None, JSONRPCError({'code': -343, 'message': 'missing JSON-RPC result'}))] * len(calls)
+        for response in responses:
+            error = response.get('error')
+            if error is not None:
+                results[response['id']] = (None, JSONRPCError(error))
+            else:
+                results[response['id']] = (response.get('result'), None)
+        return results
+
+    def _fetch_transaction(self, tx_id, timeout_duration=2):
+        if self.use_public_api:
+            return self.api_get_json(f"tx/{tx_id}", timeout_duration)
+        # The verbose transaction is the decoded transaction plus its block hash
+        # and confirmations, so one call serves every view
         try:
-            raw_tx = p.getrawtransaction(tx_id)
-            decoded_tx = p.decoderawtransaction(raw_tx)
-            return decoded_tx
+            return self.rpc('getrawtransaction', tx_id, 1)  # 1 for verbose output
         except Exception as e:
             print(f"Local node RPC error: {e}")
             return None
 
-def get_block_data_from_tx_id(tx_id, timeout_duration=2):
-    if USE_PUBLIC_API:
+    def _fetch_raw_transaction(self, tx_id, timeout_duration=2):
+        if self.use_public_api:
+            # Binary serialization, half the size of the hex or JSON responses
+            response = self.api_get(f"tx/{tx_id}/raw", timeout_duration)
+            raw_tx = response.content if response is not None else None
+        else:
+            try:
+                raw_tx = hex_to_bytes(self.rpc('getrawtransaction', tx_id, 0))  # 0 for the serialized transaction
+            except Exception as e:
+                print(f"Local node RPC error: {e}")
+                return None
+        if raw_tx is None:
+            return None
+        # The serialization hashes to the txid, anything else is a wrong or corrupt response
         try:
-            tx = get_full_transaction_from_tx_id(tx_id, timeout_duration)
-            block_hash = tx['status']['block_hash']
-            primary_url = f'{PUBLIC_API_ENDPOINT}block/{block_hash}'
-            primary_response = requests.get(primary_url, timeout=timeout_duration)
-            primary_response.raise_for_status()
-            return primary_response.json()
-        except (requests.HTTPError, requests.ConnectionError, requests.Timeout):
-            print("Primary source failed. Attempting to get block data from the secondary source.")
-            fallback_url = f'{FALLBACK_API_ENDPOINT}block/{block_hash}'
-            fallback_response = requests.get(fallback_url, timeout=timeout_duration)
-            fallback_response.raise_for_status()
-            return fallback_response.json()
-    else:
-        # Use local node
-        service_url = f'http://{LOCAL_NODE_RPC_USER}:{LOCAL_NODE_RPC_PASSWORD}@{LOCAL_NODE_RPC_URL}'
-        p = RawProxy(service_url=service_url)
+            matches = deserialize_transaction(raw_tx).txid == tx_id.lower()
+        except (IndexError, ValueError):
+            matches = False
+        if not matches:
+            print(f"Raw transaction returned for {tx_id} does not match the txid.")
+            return None
+        return raw_tx
+
+    def get_blockchain_info(self):
+        if self.use_public_api:
+            print("Error: This function is only available when using a local node.")
+            return None
         try:
-            # Fetch the block hash using the transaction ID
-            # Note: This might require a different approach depending on how the local node RPC is set up
-            raw_tx = p.getrawtransaction(tx_id, 1)  # 1 for verbose output
-            block_hash = raw_tx.get('blockhash', None)
-            if block_hash:
-                block_data = p.getblock(block_hash)
-                return block_data
+            return self.rpc('getblockchaininfo')
+        except Exception as e:
+            print(f"Local node RPC error: {e}")
+            return None
+
+    def get_full_transaction(self, tx_id, timeout_duration=2):
+        return self.transaction_store.get(tx_id, timeout_duration)
+
+    def get_transactions(self, tx_ids, batch_size=RPC_BATCH_SIZE, timeout_duration=2):
+        # Fetches many transactions at once. Returns (tx, error) pairs in the order
+        # of tx_ids. On a local node uncached txids are requested in JSON-RPC batches
+        # of batch_size, one round trip per batch instead of one per transaction.
+        tx_ids = list(tx_ids)
+        if self.use_public_api:
+            results = []
+            for tx_id in tx_ids:
+                tx = self.transaction_store.get(tx_id, timeout_duration)
+                results.append((tx, None) if tx is not None else (None, f"Could not retrieve transaction {tx_id}"))
+            return results
+
+        results = [None] * len(tx_ids)
+        missing = []
+        for index, tx_id in enumerate(tx_ids):
+            tx = self.transaction_store.get_cached(tx_id)
+            if tx is not None:
+                results[index] = (tx, None)
             else:
-                print("Block hash not found in the transaction data.")
-                return None
+                missing.append(index)
+
+        for batch_start in range(0, len(missing), batch_size):
+            batch = missing[batch_start:batch_start + batch_size]
+            calls = [('getrawtransaction', (tx_ids[index], 1)) for index in batch]
+            try:
+                batch_results = self.rpc_batch(calls)
+            except Exception as e:
+                print(f"Local node RPC error: {e}")
+                batch_results = [(None, e)] * len(batch)
+            for index, (tx, error) in zip(batch, batch_results):
+                results[index] = (tx, error)
+                if tx is not None:
+                    self.transaction_store.put(tx_ids[index], tx)
+        return results
+
+    def get_tip_height(self, timeout_duration=2):
+        # Height of the best chain's tip
+        if self.use_public_api:
+            response = self.api_get("blocks/tip/height", timeout_duration)
+            return int(response.text) if response is not None else None
+        info = self.get_blockchain_info()
+        return info['blocks'] if info is not None else None
+
+    def get_block_hash(self, height, timeout_duration=2):
+        if self.use_public_api:
+            response = self.api_get(f"block-height/{height}", timeout_duration)
+            return response.text.strip() if response is not None else None
+        try:
+            return self.rpc('getblockhash', height)
         except Exception as e:
             print(f"Local node RPC error: {e}")
             return None
 
-def get_witness_data_from_tx_id(tx_id, timeout_duration=2):
-    if USE_PUBLIC_API:
+    def get_raw_block(self, height_or_hash, timeout_duration=10):
+        # Returns the serialized block as bytes. Accepts a block height or a block hash.
+        block_hash = height_or_hash
+        if isinstance(height_or_hash, int) or len(str(height_or_hash)) < 64:
+            block_hash = self.get_block_hash(int(height_or_hash), timeout_duration)
+            if block_hash is None:
+                return None
+        if self.use_public_api:
+            response = self.api_get(f"block/{block_hash}/raw", timeout_duration)
+            return response.content if response is not None else None
         try:
-            primary_url = f'{PUBLIC_API_ENDPOINT}tx/{tx_id}'
-            primary_response = requests.get(primary_url, timeout=timeout_duration)
-            primary_response.raise_for_status()
-            tx_witness = ''.join(primary_response.json()['vin'][0]['witness'])
-            return tx_witness
-        except (requests.HTTPError, requests.ConnectionError, requests.Timeout):
-            print("Primary source failed. Attempting to get witness data from the secondary source.")
-            fallback_url = f'{FALLBACK_API_ENDPOINT}tx/{tx_id}'
-            fallback_response = requests.get(fallback_url, timeout=timeout_duration)
-            fallback_response.raise_for_status()
-            # Adjust parsing if needed
-            tx_witness = ''.join(fallback_response.json()['vin'][0]['witness'])
-            return tx_witness
-    else:
-        # Use local node
-        service_url = f'http://{LOCAL_NODE_RPC_USER}:{LOCAL_NODE_RPC_PASSWORD}@{LOCAL_NODE_RPC_URL}'
-        p = RawProxy(service_url=service_url)
+            return hex_to_bytes(self.rpc('getblock', block_hash, 0))  # 0 for the serialized block
+        except Exception as e:
+            print(f"Local node RPC error: {e}")
+            return None
+
+    def get_block_data(self, tx_id, timeout_duration=2):
+        tx = self.transaction_store.get(tx_id, timeout_duration)
+        if tx is None:
+            return None
+        if self.use_public_api:
+            block_hash = tx['status'].get('block_hash')
+        else:
+            block_hash = tx.get('blockhash')
+        if not block_hash:
+            print("Block hash not found in the transaction data.")
+            return None
+        if self.use_public_api:
+            return self.api_get_json(f"block/{block_hash}", timeout_duration)
         try:
-            raw_tx = p.getrawtransaction(tx_id, 1)  # 1 for verbose output
-            vin = raw_tx.get('vin', [{}])[0]
-            tx_witness = ''.join(vin.get('txinwitness', []))
-            return tx_witness
+            return self.rpc('getblock', block_hash)
         except Exception as e:
             print(f"Local node RPC error: {e}")
             return None
 
+    def get_raw_transaction(self, tx_id, timeout_duration=2):
+        return self.raw_transaction_store.get(tx_id, timeout_duration)
+
+    def get_transaction(self, tx_id, timeout_duration=2):
+        # Fetches only the serialized transaction and deserializes it locally
+        raw_tx = self.raw_transaction_store.get(tx_id, timeout_duration)
+        if raw_tx is None:
+            return None
+        return deserialize_transaction(raw_tx)
+
+    def get_witness_stacks(self, tx_id, timeout_duration=2):
+        # Returns the witness of every input as a list of elements. The elements are
+        # memoryviews into the raw transaction.
+        tx = self.get_transaction(tx_id, timeout_duration)
+        if tx is None:
+            return None
+        return [tx_input.witness for tx_input in tx.inputs]
+
+    def get_witness_data(self, tx_id, timeout_duration=2):
+        tx = self.transaction_store.get(tx_id, timeout_duration)
+        if tx is None:
+            return None
+        return witness_data_from_transaction(tx)
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_client():
+    # Returns the process-wide client used by the module-level functions
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OrdinalsClient()
+        return _default_client
+
+def get_blockchain_info(timeout_duration=2):
+    return get_client().get_blockchain_info()
+
+def get_tip_height(timeout_duration=2):
+    return get_client().get_tip_height(timeout_duration)
+
+def get_full_transaction_from_tx_id(tx_id, timeout_duration=2):
+    return get_client().get_full_transaction(tx_id, timeout_duration)
+
+def get_transactions(tx_ids, batch_size=RPC_BATCH_SIZE, timeout_duration=2):
+    return get_client().get_transactions(tx_ids, batch_size, timeout_duration)
+
+def get_block_data_from_tx_id(tx_id, timeout_duration=2):
+    return get_client().get_block_data(tx_id, timeout_duration)
+
+def get_witness_data_from_tx_id(tx_id, timeout_duration=2):
+    return get_client().get_witness_data(tx_id, timeout_duration)
+
+def get_raw_transaction_from_tx_id(tx_id, timeout_duration=2):
+    return get_client().get_raw_transaction(tx_id, timeout_duration)
+
+def get_transaction_from_tx_id(tx_id, timeout_duration=2):
+    return get_client().get_transaction(tx_id, timeout_duration)
+
+def get_witness_stacks_from_tx_id(tx_id, timeout_duration=2):
+    return get_client().get_witness_stacks(tx_id, timeout_duration)
+
+def get_inscriptions_from_tx_id(tx_id, timeout_duration=2):
+    # Returns every inscription of a transaction, across all of its inputs
+    witness_stacks = get_witness_stacks_from_tx_id(tx_id, timeout_duration)
+    if witness_stacks is None:
+        return None
+    return find_envelopes(witness_stacks)
+
+# Default number of concurrent requests made by fetch_many
+ASYNC_CONCURRENCY = HTTP_POOL_SIZE
+
+# Async variants of the fetch functions. Requests run on worker threads over the
+# client's pooled sessions, so primary/fallback handling and the transaction store
+# are shared with the synchronous functions above.
+async def _run_in_thread(function, *args, executor=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, function, *args)
+
+async def get_full_transaction_from_tx_id_async(tx_id, timeout_duration=2, executor=None):
+    return await _run_in_thread(get_full_transaction_from_tx_id, tx_id, timeout_duration, executor=executor)
+
+async def get_block_data_from_tx_id_async(tx_id, timeout_duration=2, executor=None):
+    return await _run_in_thread(get_block_data_from_tx_id, tx_id, timeout_duration, executor=executor)
+
+async def get_witness_data_from_tx_id_async(tx_id, timeout_duration=2, executor=None):
+    return await _run_in_thread(get_witness_data_from_tx_id, tx_id, timeout_duration, executor=executor)
+
+async def fetch_many(tx_ids, fetch=get_full_transaction_from_tx_id_async, concurrency=ASYNC_CONCURRENCY, timeout_duration=2):
+    # Runs fetch for every txid with at most concurrency requests in flight and
+    # yields (tx_id, result) pairs as they complete. Closing the generator or
+    # cancelling the consuming task cancels all requests that have not started.
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def fetch_one(tx_id):
+        async with semaphore:
+            return tx_id, await fetch(tx_id, timeout_duration, executor=executor)
+
+    tasks = [asyncio.ensure_future(fetch_one(tx_id)) for tx_id in tx_ids]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def hex_to_bytes(hex_string):
-    return bytes.fromhex(hex_string)
+    if not metrics.enabled:
+        return decode_hex(hex_string)
+    with metrics.timer('stage_seconds', stage='decode', codec='hex'):
+        data = decode_hex(hex_string)
+    metrics.increment('stage_bytes_total', len(hex_string), stage='decode', direction='in')
+    metrics.increment('stage_bytes_total', len(data), stage='decode', direction='out')
+    return data
 
 def bytes_to_ascii(byte_data):
     return byte_data.decode('ascii')
@@ -137,71 +559,652 @@ def mime_type_to_extension(mime_type):
     }
     return mapping.get(mime_type, 'bin')  # Default to 'bin' for binary data
 
-def find_envelope_and_inscription(hex_string):
-    # Define the envelope format and opcodes in hex
-    OP_FALSE = '00'
-    OP_IF = '63'
-    ORD = '036f7264'
-    OP_1 = '0101'
-    OP_0 = '00'
-    OP_PUSHDATA1 = '4c'
-    OP_PUSHDATA2 = '4d'
-    OP_PUSHDATA4 = '4e'
-    OP_ENDIF = '68'
-
-    # Search for the envelope start
-    envelope_start_seq = OP_FALSE + OP_IF + ORD + OP_1
-    start_index = hex_string.find(envelope_start_seq)
-    if start_index == -1:
-        print("Envelope start sequence not found.")
-        return None, None
+# Script opcodes used by the envelope parser
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+OP_1NEGATE = 0x4f
+OP_1 = 0x51
+OP_16 = 0x60
+OP_IF = 0x63
+OP_ENDIF = 0x68
 
-    # Extract MIME type description
-    mime_type_length_index = start_index + len(envelope_start_seq)
-    mime_type_length_hex = hex_string[mime_type_length_index:mime_type_length_index + 2]
-    mime_type_length = int(mime_type_length_hex, 16) * 2  # Length in characters
-    mime_type_start = mime_type_length_index + 2
-    mime_type_end = mime_type_start + mime_type_length
-    mime_type_hex = hex_string[mime_type_start:mime_type_end]
-    mime_type = bytes.fromhex(mime_type_hex).decode('ascii')
-
-    # Find and collect inscription data chunks
-    data_start = mime_type_end + 2  # Skipping OP_0
-    inscription_data = ''
-    while hex_string[data_start:data_start + 2] != OP_ENDIF:
-        opcode_hex = hex_string[data_start:data_start + 2]
-        opcode = int(opcode_hex, 16)
-        data_start += 2
-        chunk_length = 0
-        if '01' <= opcode_hex <= '4b':  # Direct push of 1-75 bytes
-            chunk_length = opcode * 2  # Length in characters
-        elif opcode_hex in [OP_PUSHDATA1, OP_PUSHDATA2, OP_PUSHDATA4]:
-            length_bytes = 2 if opcode_hex == OP_PUSHDATA1 else 4 if opcode_hex == OP_PUSHDATA2 else 8
-            chunk_length_hex = hex_string[data_start:data_start + length_bytes]
-            # Convert hex string to byte array in little-endian format and get length
-            chunk_length = int.from_bytes(bytes.fromhex(chunk_length_hex), 'little') * 2
-            data_start += length_bytes
-        else:
+# Number of little-endian length bytes following each OP_PUSHDATA opcode
+_PUSHDATA_SIZES = {OP_PUSHDATA1: 1, OP_PUSHDATA2: 2, OP_PUSHDATA4: 4}
+
+# OP_FALSE OP_IF OP_PUSH "ord"
+ENVELOPE_START = bytes.fromhex('0063036f7264')
+# re works directly on memoryviews, so searching does not copy the witness
+_ENVELOPE_START_PATTERN = re.compile(re.escape(ENVELOPE_START))
+
+# Envelope field tags, see https://docs.ordinals.com/inscriptions.html
+TAG_CONTENT_TYPE = 1
+TAG_POINTER = 2
+TAG_PARENT = 3
+TAG_METADATA = 5
+TAG_METAPROTOCOL = 7
+TAG_CONTENT_ENCODING = 9
+TAG_DELEGATE = 11
+
+# Largest body iter_decoded_chunks produces. A few hundred kilobytes of gzip or brotli
+# can expand to gigabytes, bodies decoding to more than this are treated as invalid.
+MAX_DECODED_SIZE = 16 * 1024 * 1024
+
+def _inscription_id(value):
+    # Inscription ids are serialized as the reversed txid followed by the
+    # little-endian index with trailing zero bytes omitted
+    value = bytes(value)
+    return f"{value[:32][::-1].hex()}i{int.from_bytes(value[32:], 'little')}"
+
+class Inscription(object):
+    # Compact record of a parsed envelope. Nothing is copied while parsing, the
+    # record only holds (start, end) offsets into the witness buffer: one list per
+    # field tag in fields and one entry per data chunk of the body in chunks.
+    # input_index and witness_index locate the witness element holding the envelope
+    # when it was found through find_envelopes, offset is relative to that element.
+    __slots__ = ('fields', 'offset', 'end', 'chunks', 'input_index', 'witness_index', '_buffer', '_body')
+
+    def __init__(self, fields, buffer, chunks, offset, end):
+        self.fields = fields
+        self.offset = offset
+        self.end = end
+        self.chunks = chunks
+        self.input_index = None
+        self.witness_index = None
+        self._buffer = buffer
+        self._body = None
+
+    def __repr__(self):
+        return (f"Inscription(mime_type={self.mime_type!r}, input_index={self.input_index}, "
+                f"offset={self.offset}, size={self.size}, chunks={len(self.chunks)})")
+
+    def field(self, tag):
+        # Returns the value of a field as bytes, or None if the envelope does not have
+        # the field. Like ord, metadata pushed in several parts is joined, and for
+        # other repeated tags (e.g. two content types) the first value counts.
+        spans = self.fields.get(tag)
+        if spans is None:
+            return None
+        if tag == TAG_METADATA:
+            return b''.join(self._buffer[start:end] for start, end in spans)
+        start, end = spans[0]
+        return bytes(self._buffer[start:end])
+
+    def _text_field(self, tag):
+        # Tag values are untrusted, bytes that are not ASCII become U+FFFD instead of raising
+        value = self.field(tag)
+        return value.decode('ascii', errors='replace') if value is not None else None
+
+    @property
+    def mime_type(self):
+        return self._text_field(TAG_CONTENT_TYPE)
+
+    @property
+    def content_encoding(self):
+        return self._text_field(TAG_CONTENT_ENCODING)
+
+    @property
+    def metaprotocol(self):
+        return self._text_field(TAG_METAPROTOCOL)
+
+    @property
+    def metadata(self):
+        # CBOR encoded metadata as raw bytes
+        return self.field(TAG_METADATA)
+
+    @property
+    def pointer(self):
+        value = self.field(TAG_POINTER)
+        return int.from_bytes(value, 'little') if value is not None else None
+
+    @property
+    def parents(self):
+        # The parent tag can be repeated, each occurrence is one parent
+        return [_inscription_id(self._buffer[start:end]) for start, end in self.fields.get(TAG_PARENT, [])]
+
+    @property
+    def delegate(self):
+        value = self.field(TAG_DELEGATE)
+        return _inscription_id(value) if value is not None else None
+
+    @property
+    def size(self):
+        return sum(end - start for start, end in self.chunks)
+
+    def iter_chunks(self):
+        # Yields memoryview slices into the witness buffer without copying
+        for start, end in self.chunks:
+            yield self._buffer[start:end]
+
+    def iter_decoded_chunks(self, max_size=MAX_DECODED_SIZE):
+        # Yields the body with its content encoding removed. Chunks are decompressed
+        # one at a time, so neither the compressed nor the decompressed body is ever
+        # held in memory as a whole. Every step produces at most what is left of
+        # max_size, and ValueError is raised once the body would exceed it.
+        encoding = self.content_encoding
+        if encoding is None:
+            yield from self.iter_chunks()
+            return
+        decompressor = create_decompressor(encoding)
+        decoded_size = 0
+
+        def checked(decoded):
+            nonlocal decoded_size
+            decoded_size += len(decoded)
+            if decoded_size > max_size:
+                raise ValueError(f"Decoded inscription is larger than {max_size} bytes.")
+            return decoded
+
+        for chunk in self.iter_chunks():
+            decoded = checked(decompressor.decompress(chunk, max_size - decoded_size + 1))
+            if decoded:
+                yield decoded
+            while decompressor.pending:
+                decoded = checked(decompressor.decompress(b'', max_size - decoded_size + 1))
+                if decoded:
+                    yield decoded
+        decoded = checked(decompressor.flush(max_size - decoded_size + 1))
+        if decoded:
+            yield decoded
+
+    @property
+    def body(self):
+        # Joined lazily and only once
+        if self._body is None:
+            self._body = b''.join(self.iter_chunks())
+        return self._body
+
+    def hex(self):
+        return self.body.hex()
+
+class _ZlibDecompressor(object):
+    # Input zlib could not decompress within max_length is kept and decompressed by
+    # the next calls, pending tells whether there is any left
+    def __init__(self):
+        # Accepts gzip as well as zlib headers
+        self._decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 32)
+
+    @property
+    def pending(self):
+        return bool(self._decompressor.unconsumed_tail)
+
+    def decompress(self, data, max_length):
+        if self._decompressor.unconsumed_tail:
+            data = self._decompressor.unconsumed_tail + bytes(data)
+        return self._decompressor.decompress(data, max_length)
+
+    def flush(self, max_length):
+        return self._decompressor.flush(max_length)
+
+class _BrotliDecompressor(object):
+    # Gives brotli's decompressor the same interface. Output is bounded per step with
+    # brotli 1.2 or newer, older versions decompress a whole chunk at once.
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()
+        self._bounded = hasattr(self._decompressor, 'can_accept_more_data')
+
+    @property
+    def pending(self):
+        return self._bounded and not self._decompressor.can_accept_more_data()
+
+    def decompress(self, data, max_length):
+        if not self._bounded:
+            return self._decompressor.process(bytes(data))
+        return self._decompressor.process(bytes(data), output_buffer_limit=max_length)
+
+    def flush(self, max_length):
+        if not self._decompressor.is_finished():
+            raise ValueError("Brotli stream is truncated.")
+        return b''
+
+def create_decompressor(content_encoding):
+    # Returns an incremental decompressor with decompress(chunk, max_length), flush(max_length)
+    # and pending, which is true while output of earlier input is still waiting
+    if content_encoding in ('gzip', 'deflate'):
+        return _ZlibDecompressor()
+    if content_encoding == 'br':
+        if brotli is None:
+            raise ValueError("Brotli encoded inscriptions require the brotli package.")
+        return _BrotliDecompressor()
+    raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+def _read_push(data, position):
+    # Returns the (start, end) of the pushed data, or None if the opcode at
+    # position is not a data push or the push runs past the end of the buffer
+    if position >= len(data):
+        return None
+    opcode = data[position]
+    position += 1
+    if opcode <= 0x4b:  # OP_0 and direct pushes of 1-75 bytes
+        length = opcode
+    elif opcode in _PUSHDATA_SIZES:
+        size = _PUSHDATA_SIZES[opcode]
+        if position + size > len(data):
+            return None
+        length = int.from_bytes(data[position:position + size], 'little')
+        position += size
+    else:
+        return None
+    end = position + length
+    if end > len(data):
+        return None
+    return position, end
+
+def _read_tag(data, position):
+    # Reads a field tag, which may be a data push or one of OP_1NEGATE and OP_1 to
+    # OP_16. Returns the tag (None for the empty push that starts the body) and
+    # the position after it, or None if there is no tag at position.
+    opcode = data[position]
+    if OP_1 <= opcode <= OP_16:
+        return opcode - OP_1 + 1, position + 1
+    if opcode == OP_1NEGATE:
+        return 0x81, position + 1
+    push = _read_push(data, position)
+    if push is None:
+        return None
+    start, end = push
+    if start == end:
+        return None, end
+    return int.from_bytes(data[start:end], 'little'), end
+
+def parse_envelope(data, start=0):
+    # Parses the first envelope at or after start in a witness given as bytes,
+    # bytearray or memoryview. Returns an Inscription or None.
+    buffer = memoryview(data)
+    match = _ENVELOPE_START_PATTERN.search(buffer, start)
+    if match is None:
+        return None
+
+    # Collect the field tags and their values until the empty push that starts the body
+    fields = {}
+    chunks = []
+    position = match.end()
+    in_body = False
+    while position < len(buffer) and buffer[position] != OP_ENDIF:
+        if in_body:
+            push = _read_push(buffer, position)
+            if push is None:
+                print("Unexpected data format in inscription.")
+                break
+            chunks.append(push)
+            position = push[1]
+            continue
+
+        tag = _read_tag(buffer, position)
+        if tag is None:
+            print("Unexpected data format in inscription.")
+            break
+        tag, position = tag
+        if tag is None:
+            in_body = True
+            continue
+        push = _read_push(buffer, position)
+        if push is None:
             print("Unexpected data format in inscription.")
             break
+        fields.setdefault(tag, []).append(push)
+        position = push[1]
+
+    # end points past OP_ENDIF, or at the point where parsing stopped
+    end = position + 1 if position < len(buffer) and buffer[position] == OP_ENDIF else position
+    return Inscription(fields, buffer, chunks, match.start(), end)
+
+def iter_envelopes(data):
+    # Yields every envelope in a witness element, continuing each search where
+    # the previous envelope ended so the data is only scanned once
+    position = 0
+    while True:
+        inscription = parse_envelope(data, position)
+        if inscription is None:
+            return
+        yield inscription
+        position = max(inscription.end, inscription.offset + 1)
+
+# Name of every opcode, indexed by its byte value
+OPCODE_NAMES = [_BITCOIN_OPCODE_NAMES.get(CScriptOp(opcode), f'OP_UNKNOWN_{opcode:02x}') for opcode in range(256)]
+OPCODE_NAMES[0xba] = 'OP_CHECKSIGADD'
+for _length in range(1, 0x4c):
+    OPCODE_NAMES[_length] = f'OP_PUSHBYTES_{_length}'
+
+# Names of the envelope field tags used in annotations
+TAG_NAMES = {
+    TAG_CONTENT_TYPE: 'Content Type',
+    TAG_POINTER: 'Pointer',
+    TAG_PARENT: 'Parent',
+    TAG_METADATA: 'Metadata',
+    TAG_METAPROTOCOL: 'Metaprotocol',
+    TAG_CONTENT_ENCODING: 'Content Encoding',
+    TAG_DELEGATE: 'Delegate',
+}
+
+class ScriptToken(object):
+    # One opcode of a script as byte offsets into the script buffer. For data pushes
+    # the pushed data is data_start:end, for other opcodes data_start == end.
+    # truncated is set when a push runs past the end of the buffer.
+    __slots__ = ('opcode', 'start', 'data_start', 'end', 'truncated')
+
+    def __init__(self, opcode, start, data_start, end, truncated=False):
+        self.opcode = opcode
+        self.start = start
+        self.data_start = data_start
+        self.end = end
+        self.truncated = truncated
+
+    def __repr__(self):
+        return f"ScriptToken({OPCODE_NAMES[self.opcode]}, start={self.start}, end={self.end})"
+
+    @property
+    def name(self):
+        return OPCODE_NAMES[self.opcode]
+
+def iter_script_tokens(data, start=0, end=None):
+    # Splits a script into opcodes in a single pass, yielding ScriptTokens
+    buffer = memoryview(data)
+    end = len(buffer) if end is None else end
+    position = start
+    while position < end:
+        opcode = buffer[position]
+        data_start = position + 1
+        length = 0
+        if opcode <= 0x4b:
+            length = opcode
+        elif opcode in _PUSHDATA_SIZES:
+            data_start += _PUSHDATA_SIZES[opcode]
+            length = int.from_bytes(buffer[position + 1:min(data_start, end)], 'little')
+        token_end = data_start + length
+        if token_end > end:
+            yield ScriptToken(opcode, position, min(data_start, end), end, truncated=True)
+            return
+        yield ScriptToken(opcode, position, data_start, token_end)
+        position = token_end
+
+def annotate_envelopes(data):
+    # Labels the envelopes in a witness for display. Returns (start, end, label) byte
+    # spans that cover the whole buffer in order. Bytes outside of envelopes are
+    # returned as a single span with label None.
+    buffer = memoryview(data)
+    spans = []
+    position = 0
+    for inscription in iter_envelopes(buffer):
+        if inscription.offset > position:
+            spans.append((position, inscription.offset, None))
+        tokens = iter_script_tokens(buffer, inscription.offset, inscription.end)
 
-        chunk_start = data_start
-        chunk_end = chunk_start + chunk_length
-        inscription_data += hex_string[chunk_start:chunk_end]
-        data_start = chunk_end
+        # OP_FALSE OP_IF OP_PUSH "ord"
+        for label in ('OP_FALSE', 'OP_IF', 'OP_PUSH "ord"'):
+            token = next(tokens)
+            spans.append((token.start, token.end, label))
+
+        tag = None
+        in_body = False
+        for token in tokens:
+            if token.truncated:
+                spans.append((token.start, token.end, 'Truncated Data Push'))
+            elif token.opcode == OP_ENDIF:
+                spans.append((token.start, token.end, 'OP_ENDIF'))
+            elif in_body:
+                if token.opcode in _PUSHDATA_SIZES:
+                    spans.append((token.start, token.start + 1, token.name))
+                    spans.append((token.start + 1, token.data_start, f"Data Length: {token.end - token.data_start} bytes"))
+                    spans.append((token.data_start, token.end, 'Data Chunk'))
+                else:
+                    spans.append((token.start, token.end, f"Direct Data Push: {token.end - token.data_start} bytes"))
+            elif tag is None:
+                # Tag, or the empty push that starts the body
+                if token.start + 1 == token.end and token.opcode == OP_0:
+                    spans.append((token.start, token.end, 'OP_PUSH 0'))
+                    in_body = True
+                    continue
+                if OP_1 <= token.opcode <= OP_16:
+                    tag = token.opcode - OP_1 + 1
+                else:
+                    tag = int.from_bytes(buffer[token.data_start:token.end], 'little')
+                spans.append((token.start, token.end, f"OP_PUSH {tag}"))
+            else:
+                text = bytes(buffer[token.data_start:token.end]).decode('ascii', 'replace')
+                if tag == TAG_CONTENT_TYPE:
+                    label = f'MIME Type: "{text}"'
+                elif tag in (TAG_CONTENT_ENCODING, TAG_METAPROTOCOL):
+                    label = f'{TAG_NAMES[tag]}: "{text}"'
+                else:
+                    label = f"{TAG_NAMES.get(tag, f'Tag {tag}')}: {token.end - token.data_start} bytes"
+                spans.append((token.start, token.end, label))
+                tag = None
+        position = inscription.end
+
+    if position < len(buffer):
+        spans.append((position, len(buffer), None))
+    return spans
+
+def find_envelopes(witness_stacks):
+    # Finds every envelope in every input's witness in one pass. witness_stacks holds
+    # one list of witness elements (bytes-like) per input, elements keep their
+    # boundaries so envelopes cannot be matched across two elements.
+    inscriptions = []
+    parsed_bytes = 0
+    with metrics.timer('stage_seconds', stage='parse'):
+        for input_index, stack in enumerate(witness_stacks):
+            for witness_index, item in enumerate(stack):
+                parsed_bytes += len(item)
+                for inscription in iter_envelopes(item):
+                    inscription.input_index = input_index
+                    inscription.witness_index = witness_index
+                    inscriptions.append(inscription)
+    metrics.increment('stage_bytes_total', parsed_bytes, stage='parse', direction='in')
+    return inscriptions
+
+def find_envelope_and_inscription(hex_string):
+    # Accepts the witness as a hex string (or raw bytes) and parses it as bytes
+    if isinstance(hex_string, str):
+        data = hex_to_bytes(hex_string)
+    else:
+        data = hex_string
+    with metrics.timer('stage_seconds', stage='parse'):
+        inscription = parse_envelope(data)
+    metrics.increment('stage_bytes_total', len(data), stage='parse', direction='in')
+    if inscription is None:
+        print("Envelope start sequence not found.")
+        return None, None
 
     # Return the MIME type and inscription data in hex format
-    return mime_type, inscription_data
+    return inscription.mime_type, inscription.hex()
 
 
-def inscription_data_to_file(mime_type, hex_string, output_file):
-    # Convert hex string to bytes
-    binary_data = bytes(int(hex_string[i:i+2], 16) for i in range(0, len(hex_string), 2))
+# Number of bytes collected before they are handed to the operating system in one writev call
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Maximum number of buffers passed to a single writev call (IOV_MAX is 1024 on Linux)
+WRITEV_MAX_BUFFERS = 512
+
+def _writev_all(descriptor, buffers):
+    # writev may write less than requested, continue with whatever is left
+    buffers = [memoryview(buffer).cast('B') for buffer in buffers]
+    while buffers:
+        written = os.writev(descriptor, buffers)
+        while buffers and written >= len(buffers[0]):
+            written -= len(buffers[0])
+            buffers.pop(0)
+        if buffers and written:
+            buffers[0] = buffers[0][written:]
 
+def write_chunks_atomically(chunks, path):
+    # Writes an iterable of bytes-like chunks to path. The data goes to a temporary
+    # file in the same directory that is renamed over path once complete, so readers
+    # never see a partially written file. Memoryview chunks are written without copying.
+    with metrics.timer('stage_seconds', stage='write'):
+        _write_chunks_atomically(chunks, path)
+    if metrics.enabled:
+        metrics.increment('stage_bytes_total', os.path.getsize(path), stage='write', direction='out')
+
+def _write_chunks_atomically(chunks, path):
+    temp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+    descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        if hasattr(os, 'writev'):
+            batch = []
+            batch_size = 0
+            for chunk in chunks:
+                batch.append(chunk)
+                batch_size += len(chunk)
+                if batch_size >= WRITE_BUFFER_SIZE or len(batch) >= WRITEV_MAX_BUFFERS:
+                    _writev_all(descriptor, batch)
+                    batch = []
+                    batch_size = 0
+            if batch:
+                _writev_all(descriptor, batch)
+            # Cleared before closing, so the descriptor number is never closed twice: once
+            # closed it may already belong to a file another thread opened
+            closing, descriptor = descriptor, None
+            os.close(closing)
+        else:
+            # No writev on Windows, use a buffered file instead. The file owns the
+            # descriptor from here on and closes it, also when writing fails.
+            file, descriptor = os.fdopen(descriptor, 'wb', buffering=WRITE_BUFFER_SIZE), None
+            with file:
+                for chunk in chunks:
+                    file.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        if descriptor is not None:
+            try:
+                os.close(descriptor)
+            except OSError:
+                pass
+        os.unlink(temp_path)
+        raise
+
+def write_inscription(inscription, output_file, decode_content=True):
+    # Streams the inscription body to output_file with the extension of its MIME type
+    # and returns the final path. With decode_content the content encoding (e.g. gzip)
+    # is removed chunk by chunk while writing.
+    output_file_with_extension = f"{output_file}.{mime_type_to_extension(inscription.mime_type)}"
+    chunks = inscription.iter_decoded_chunks() if decode_content else inscription.iter_chunks()
+    write_chunks_atomically(chunks, output_file_with_extension)
+    return output_file_with_extension
+
+def inscription_data_to_file(mime_type, hex_string, output_file):
     # Determine the file extension
     extension = mime_type_to_extension(mime_type)
     output_file_with_extension = f"{output_file}.{extension}"
 
-    # Save binary data to a file
-    with open(output_file_with_extension, 'wb') as file:
-        file.write(binary_data)
\ No newline at end of file
+    # Convert the hex string to bytes and save it to the file
+    write_chunks_atomically([decode_hex(hex_string)], output_file_with_extension)
+
+# Raw transaction and block deserialization. Witness items and scripts are
+# memoryview slices into the raw buffer, nothing is copied or hex-encoded.
+class TxInput(object):
+    __slots__ = ('prev_txid', 'prev_index', 'script_sig', 'sequence', 'witness')
+
+    def __init__(self, prev_txid, prev_index, script_sig, sequence):
+        self.prev_txid = prev_txid
+        self.prev_index = prev_index
+        self.script_sig = script_sig
+        self.sequence = sequence
+        self.witness = []
+
+class Transaction(object):
+    __slots__ = ('txid', 'version', 'inputs', 'outputs', 'locktime')
+
+    def __init__(self, txid, version, inputs, outputs, locktime):
+        self.txid = txid
+        self.version = version
+        self.inputs = inputs
+        self.outputs = outputs  # List of (value in sats, script_pubkey) pairs
+        self.locktime = locktime
+
+    def __repr__(self):
+        return f"Transaction(txid={self.txid!r}, inputs={len(self.inputs)}, outputs={len(self.outputs)})"
+
+def _read_varint(data, position):
+    prefix = data[position]
+    if prefix < 0xfd:
+        return prefix, position + 1
+    size = {0xfd: 2, 0xfe: 4, 0xff: 8}[prefix]
+    return int.from_bytes(data[position + 1:position + 1 + size], 'little'), position + 1 + size
+
+def _read_bytes(data, position):
+    length, position = _read_varint(data, position)
+    end = position + length
+    if end > len(data):
+        raise ValueError("Unexpected end of transaction data.")
+    return data[position:end], end
+
+def _double_sha256_id(*parts):
+    first = hashlib.sha256()
+    for part in parts:
+        first.update(part)
+    return hashlib.sha256(first.digest()).digest()[::-1].hex()
+
+def read_transaction(data, position=0):
+    # Deserializes the transaction starting at position in a memoryview and
+    # returns it together with the position after it
+    start = position
+    version = int.from_bytes(data[position:position + 4], 'little')
+    position += 4
+    has_witness = data[position] == 0 and data[position + 1] != 0
+    if has_witness:
+        position += 2  # Segwit marker and flag
+
+    # The txid hashes the transaction without marker, flag and witnesses
+    body_start = position
+    input_count, position = _read_varint(data, position)
+    inputs = []
+    for _ in range(input_count):
+        prev_txid = bytes(data[position:position + 32][::-1]).hex()
+        prev_index = int.from_bytes(data[position + 32:position + 36], 'little')
+        script_sig, position = _read_bytes(data, position + 36)
+        sequence = int.from_bytes(data[position:position + 4], 'little')
+        position += 4
+        inputs.append(TxInput(prev_txid, prev_index, script_sig, sequence))
+
+    output_count, position = _read_varint(data, position)
+    outputs = []
+    for _ in range(output_count):
+        value = int.from_bytes(data[position:position + 8], 'little')
+        script_pubkey, position = _read_bytes(data, position + 8)
+        outputs.append((value, script_pubkey))
+    body_end = position
+
+    if has_witness:
+        for tx_input in inputs:
+            item_count, position = _read_varint(data, position)
+            for _ in range(item_count):
+                item, position = _read_bytes(data, position)
+                tx_input.witness.append(item)
+
+    locktime = int.from_bytes(data[position:position + 4], 'little')
+    txid = _double_sha256_id(data[start:start + 4], data[body_start:body_end], data[position:position + 4])
+    position += 4
+    return Transaction(txid, version, inputs, outputs, locktime), position
+
+def deserialize_transaction(raw_tx):
+    transaction, _ = read_transaction(memoryview(raw_tx))
+    return transaction
+
+def iter_block_transactions(raw_block):
+    # Yields the transactions of a serialized block one at a time
+    data = memoryview(raw_block)
+    tx_count, position = _read_varint(data, 80)  # Skipping the 80 byte header
+    for _ in range(tx_count):
+        transaction, position = read_transaction(data, position)
+        yield transaction
+
+def block_hash_from_header(raw_block):
+    return _double_sha256_id(memoryview(raw_block)[:80])
+
+def previous_block_hash_from_header(raw_block):
+    return bytes(memoryview(raw_block)[4:36][::-1]).hex()
+
+def iter_block_inscriptions(raw_block):
+    # Yields (txid, input index, Inscription) for every envelope in every input's witness
+    for transaction in iter_block_transactions(raw_block):
+        for inscription in find_envelopes(tx_input.witness for tx_input in transaction.inputs):
+            yield transaction.txid, inscription.input_index, inscription
+
+def scan_block(height_or_hash, timeout_duration=10):
+    # Downloads a block once and yields every inscription envelope in it
+    raw_block = get_client().get_raw_block(height_or_hash, timeout_duration)
+    if raw_block is None:
+        return
+    yield from iter_block_inscriptions(raw_block)
@@ -0,0 +1,110 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+# Requests per second each public API endpoint starts with, and how far the rate
+# may adapt in either direction
+DEFAULT_RATE = 10
+MIN_RATE = 0.5
+MAX_RATE = 50
+
+# Requests an endpoint may receive at once before the rate applies
+DEFAULT_BURST = 10
+
+# Additive increase per successful request, multiplicative decrease per throttling
+RATE_INCREASE = 0.05
+RATE_DECREASE = 0.5
+
+# Backoff in seconds after a 429 without Retry-After, doubling for every 429 in a row
+BASE_BACKOFF = 1
+MAX_BACKOFF = 60
+
+# Random extra delay added to Retry-After, as a fraction of it, so throttled
+# threads do not all come back at the same moment
+RETRY_AFTER_JITTER = 0.1
+
+# Longest a request waits for its turn (including Retry-After pauses) before it
+# gives up on the endpoint. Waiting is separate from the request's own timeout,
+# bulk jobs should queue up behind the limit rather than fail.
+MAX_QUEUE_WAIT = 30
+
+def parse_retry_after(value):
+    # Retry-After holds either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket(object):
+    # Adaptive rate limiter for one endpoint, implemented as a token bucket in its
+    # theoretical-arrival-time form: every request moves the arrival time forward by
+    # one interval, and a request may start once it is at most `burst` intervals
+    # ahead. Throttling (429) halves the rate and pauses the endpoint for Retry-After
+    # or a jittered exponential backoff, every success increases the rate a little.
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, min_rate=MIN_RATE, max_rate=MAX_RATE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.paused_until = 0
+        self.consecutive_throttles = 0
+        self._arrival_time = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait):
+        # Waits for the request's turn and returns True, or returns False right away
+        # if that would take longer than max_wait seconds
+        with self._lock:
+            now = time.monotonic()
+            interval = 1 / self.rate
+            arrival_time = max(self._arrival_time, now)
+            start = max(arrival_time - (self.burst - 1) * interval, self.paused_until, now)
+            if start - now > max_wait:
+                return False
+            self._arrival_time = arrival_time + interval
+        if start > now:
+            time.sleep(start - now)
+        return True
+
+    def succeeded(self):
+        with self._lock:
+            self.consecutive_throttles = 0
+            self.rate = min(self.rate + RATE_INCREASE, self.max_rate)
+
+    def throttled(self, retry_after=None):
+        # Records a 429 response and returns the number of seconds the endpoint is paused
+        with self._lock:
+            now = time.monotonic()
+            if now >= self.paused_until:
+                # Requests sent before the pause may be throttled as well, the rate
+                # is only lowered once per pause
+                self.rate = max(self.rate * RATE_DECREASE, self.min_rate)
+                self.consecutive_throttles += 1
+            if retry_after is not None:
+                delay = retry_after * (1 + random.uniform(0, RETRY_AFTER_JITTER))
+            else:
+                backoff = min(BASE_BACKOFF * 2 ** (self.consecutive_throttles - 1), MAX_BACKOFF)
+                delay = random.uniform(backoff / 2, backoff)
+            self.paused_until = max(self.paused_until, now + delay)
+            # No burst after the pause, requests resume at the lowered rate
+            self._arrival_time = max(self._arrival_time, self.paused_until + (self.burst - 1) / self.rate)
+            return self.paused_until - now
+
+# One bucket per endpoint for the whole process, shared by every client, thread and
+# Streamlit session, since the endpoint's limit applies to all of them together
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_rate_limiter(endpoint):
+    with _buckets_lock:
+        bucket = _buckets.get(endpoint)
+        if bucket is None:
+            bucket = _buckets[endpoint] = TokenBucket()
+        return bucket
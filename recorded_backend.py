@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import random
+import secrets
+import threading
+from decimal import Decimal
+from urllib.parse import quote
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from bitcoin.rpc import JSONRPCError
+from hex_codec import decode_hex, encode_hex
+
+# Serves public API and node RPC responses from a local store of recorded responses,
+# and records live responses into that store. OrdinalsClient mounts the adapters on
+# its HTTP sessions and wraps its RPC proxy with the proxies below, so everything
+# above the transport (caching, fallbacks, parsing) runs unchanged.
+#
+# A store is either a directory with one file per response, or a single .jsonl file
+# with one {"key": ..., "body": <hex>} line per response.
+
+def api_key(path):
+    # Public API responses are keyed by path only, so responses recorded from the
+    # primary endpoint are also served for the fallback endpoint
+    return f"api/{path}"
+
+def rpc_key(method, params):
+    return f"rpc/{method}/{json.dumps(list(params), separators=(',', ':'))}"
+
+class RecordedStore(object):
+    # simulated_latency is added to every replayed request in seconds and
+    # simulated_error_rate is the fraction of replayed requests that fail
+    # with a connection error, which exercises the fallback paths.
+    def __init__(self, path, simulated_latency=0, simulated_error_rate=0):
+        self.path = os.path.expanduser(path)
+        self.simulated_latency = simulated_latency
+        self.simulated_error_rate = simulated_error_rate
+        self.single_file = self.path.endswith('.jsonl')
+        self._lock = threading.Lock()
+        self._entries = self._load_file() if self.single_file else None
+
+    def _load_file(self):
+        entries = {}
+        try:
+            with open(self.path) as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[entry['key']] = decode_hex(entry['body'])
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, quote(key, safe=''))
+
+    def read(self, key):
+        # Returns the recorded body as bytes, or None if nothing was recorded for key
+        if self.single_file:
+            return self._entries.get(key)
+        try:
+            with open(self._entry_path(key), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key, body):
+        body = bytes(body)
+        if self.single_file:
+            with self._lock:
+                if self._entries.get(key) == body:
+                    return
+                self._entries[key] = body
+                with open(self.path, 'a') as file:
+                    file.write(json.dumps({'key': key, 'body': encode_hex(body)}) + '\n')
+            return
+        # Written to a temporary file first, so concurrent readers never see partial responses
+        os.makedirs(self.path, exist_ok=True)
+        entry_path = self._entry_path(key)
+        temp_path = f"{entry_path}.{secrets.token_hex(4)}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(body)
+        os.replace(temp_path, entry_path)
+
+    def simulate(self):
+        # Applies the simulated latency and raises ConnectionError for simulated failures
+        if self.simulated_latency:
+            time.sleep(self.simulated_latency)
+        if self.simulated_error_rate and random.random() < self.simulated_error_rate:
+            raise ConnectionError("Simulated connection error")
+
+class ReplayAdapter(BaseAdapter):
+    # Transport adapter answering requests to one endpoint from the store.
+    # Requests without a recording get a 404 response.
+    def __init__(self, store, endpoint):
+        super().__init__()
+        self.store = store
+        self.endpoint = endpoint
+
+    def send(self, request, **kwargs):
+        try:
+            self.store.simulate()
+        except ConnectionError as e:
+            raise requests.ConnectionError(str(e), request=request)
+        body = self.store.read(api_key(request.url[len(self.endpoint):]))
+
+        response = requests.Response()
+        response.status_code = 200 if body is not None else 404
+        response.reason = 'OK' if body is not None else 'Not Found'
+        response._content = body if body is not None else b''
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+class RecordingAdapter(HTTPAdapter):
+    # Regular HTTP adapter that also writes every successful response to the store
+    def __init__(self, store, endpoint, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.endpoint = endpoint
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.ok:
+            self.store.write(api_key(request.url[len(self.endpoint):]), response.content)
+        return response
+
+def _dump_result(result):
+    # RawProxy parses numbers with Decimal, which json cannot serialize directly
+    return json.dumps(result, default=float).encode()
+
+def _load_result(body):
+    return json.loads(body, parse_float=Decimal)
+
+class ReplayProxy(object):
+    # Stands in for RawProxy and answers calls from the store. Calls without a
+    # recording fail the way the node fails for unknown transactions.
+    def __init__(self, store):
+        self.store = store
+
+    def _missing(self, method):
+        return {'code': -5, 'message': f"No recorded response for {method}"}
+
+    def _call(self, method, *params):
+        self.store.simulate()
+        body = self.store.read(rpc_key(method, params))
+        if body is None:
+            raise JSONRPCError(self._missing(method))
+        return _load_result(body)
+
+    def _batch(self, rpc_call_list):
+        self.store.simulate()
+        responses = []
+        for call in rpc_call_list:
+            body = self.store.read(rpc_key(call['method'], call['params']))
+            if body is None:
+                responses.append({'id': call['id'], 'result': None, 'error': self._missing(call['method'])})
+            else:
+                responses.append({'id': call['id'], 'result': _load_result(body), 'error': None})
+        return responses
+
+    def close(self):
+        pass
+
+class RecordingProxy(object):
+    # Wraps a RawProxy and writes every successful result to the store
+    def __init__(self, proxy, store):
+        self.proxy = proxy
+        self.store = store
+
+    def _call(self, method, *params):
+        result = self.proxy._call(method, *params)
+        self.store.write(rpc_key(method, params), _dump_result(result))
+        return result
+
+    def _batch(self, rpc_call_list):
+        responses = self.proxy._batch(rpc_call_list)
+        if isinstance(responses, list):
+            calls = {call['id']: call for call in rpc_call_list}
+            for response in responses:
+                call = calls.get(response.get('id'))
+                if call is not None and response.get('error') is None:
+                    self.store.write(rpc_key(call['method'], call['params']), _dump_result(response.get('result')))
+        return responses
+
+    def close(self):
+        self.proxy.close()
@@ -0,0 +1,262 @@
+import re
+import sys
+import base64
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import ordinals_parser as ord
+from content_store import ContentStore, DEFAULT_STORE_DIR
+
+# Longest chain of references followed from the requested inscription. References
+# found deeper are listed as truncated instead of being fetched.
+MAX_RECURSION_DEPTH = 8
+
+# Number of referenced inscriptions fetched at once
+RESOLVE_CONCURRENCY = ord.HTTP_POOL_SIZE
+
+# Maximum number of resolved inscriptions kept in memory. Collections share a few
+# heavy libraries, so they are resolved once and reused by every later request.
+RESOLVED_CACHE_SIZE = 256
+
+# Recursive inscriptions load other inscriptions through ord's /content/<inscription id> endpoint
+CONTENT_REFERENCE_PATTERN = re.compile(rb'/content/([0-9a-f]{64}i[0-9]+)')
+
+# Bodies of these types are searched for references, binary formats cannot load other inscriptions
+_REFERENCING_MIME_TYPES = ('text/', 'image/svg', 'application/javascript', 'application/json',
+                           'application/xml', 'application/xhtml')
+
+def parse_inscription_id(inscription_id):
+    # Splits '<txid>i<n>' into the txid and the index of the envelope in the transaction,
+    # or returns None if it is not an inscription id
+    tx_id, separator, index = inscription_id.partition('i')
+    if len(tx_id) != 64 or not separator or not index.isdigit():
+        return None
+    try:
+        bytes.fromhex(tx_id)
+    except ValueError:
+        return None
+    return tx_id.lower(), int(index)
+
+def can_reference(mime_type):
+    mime_type = (mime_type or '').strip().lower()
+    return mime_type.startswith(_REFERENCING_MIME_TYPES)
+
+def find_references(mime_type, body):
+    # Inscription ids referenced by the body, in order of first appearance
+    if not can_reference(mime_type):
+        return []
+    references = (match.group(1).decode('ascii') for match in CONTENT_REFERENCE_PATTERN.finditer(body))
+    return list(dict.fromkeys(references))
+
+class ResolvedInscription(object):
+    # One node of the dependency graph. body is the decoded content, references the
+    # inscriptions it loads (including its delegate), error the reason it could not
+    # be fetched, in which case inscription and body are None.
+    __slots__ = ('inscription_id', 'inscription', 'mime_type', 'body', 'references', 'error')
+
+    def __init__(self, inscription_id, inscription=None, mime_type=None, body=None, references=(), error=None):
+        self.inscription_id = inscription_id
+        self.inscription = inscription
+        self.mime_type = mime_type
+        self.body = body
+        self.references = list(references)
+        self.error = error
+
+    def __repr__(self):
+        return (f"ResolvedInscription(inscription_id={self.inscription_id!r}, mime_type={self.mime_type!r}, "
+                f"references={len(self.references)}, error={self.error!r})")
+
+class Resolution(object):
+    # Result of resolving one inscription: every inscription reached, keyed by id,
+    # the (referencing id, referenced id) edges that close a cycle, and the references
+    # that were not followed because they lie deeper than the depth limit.
+    __slots__ = ('root', 'inscriptions', 'depths', 'cycles', 'truncated')
+
+    def __init__(self, root, inscriptions, depths, cycles, truncated):
+        self.root = root
+        self.inscriptions = inscriptions
+        self.depths = depths
+        self.cycles = cycles
+        self.truncated = truncated
+
+    @property
+    def dependencies(self):
+        # Every reached inscription except the root, in order of depth
+        return sorted((resolved for resolved in self.inscriptions.values() if resolved is not self.root),
+                      key=lambda resolved: self.depths[resolved.inscription_id])
+
+    @property
+    def failed(self):
+        return [resolved for resolved in self.inscriptions.values() if resolved.error is not None]
+
+    def inline(self, resolved=None):
+        # Returns the body with every reference replaced by a data: URI of the referenced
+        # content, recursively, so it renders without an ord server to serve /content.
+        # References that failed, were truncated or close a cycle are left unchanged.
+        inlined = {}
+        in_progress = set()
+
+        def data_uri(inscription_id):
+            if inscription_id not in inlined:
+                resolved = self.inscriptions.get(inscription_id)
+                if resolved is None or resolved.body is None or inscription_id in in_progress:
+                    return None
+                body = inline_body(resolved)
+                inlined[inscription_id] = (f"data:{resolved.mime_type or 'application/octet-stream'};base64,"
+                                           f"{base64.b64encode(body).decode('ascii')}").encode('ascii')
+            return inlined[inscription_id]
+
+        def inline_body(resolved):
+            if not can_reference(resolved.mime_type):
+                return resolved.body
+            in_progress.add(resolved.inscription_id)
+
+            def replace(match):
+                uri = data_uri(match.group(1).decode('ascii'))
+                return uri if uri is not None else match.group(0)
+            body = CONTENT_REFERENCE_PATTERN.sub(replace, resolved.body)
+            in_progress.discard(resolved.inscription_id)
+            return body
+        return inline_body(resolved or self.root)
+
+class RecursiveResolver(object):
+    # Builds the dependency graph of recursive inscriptions. References are fetched
+    # concurrently as soon as they are discovered, every inscription is fetched and
+    # parsed at most once per resolver (concurrent requests for the same id wait for
+    # the same fetch), and graphs are only followed up to max_depth. Resolved
+    # inscriptions are kept in a bounded LRU shared by all resolve calls, so one
+    # long-lived resolver serves the shared libraries of a collection from memory.
+    def __init__(self, client=None, max_depth=MAX_RECURSION_DEPTH, concurrency=RESOLVE_CONCURRENCY,
+                 cache_size=RESOLVED_CACHE_SIZE):
+        self.client = client or ord.get_client()
+        self.max_depth = max_depth
+        # Inscriptions are immutable, only failed fetches are retried
+        self._store = ord.TransactionStore(self._fetch, lambda resolved: resolved.error is None, cache_size,
+                                           'inscriptions')
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='resolver')
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _fetch(self, inscription_id, timeout_duration):
+        location = parse_inscription_id(inscription_id)
+        if location is None:
+            return ResolvedInscription(inscription_id, error='invalid inscription id')
+        tx_id, index = location
+        witness_stacks = self.client.get_witness_stacks(tx_id, timeout_duration)
+        if witness_stacks is None:
+            return ResolvedInscription(inscription_id, error='could not retrieve the transaction')
+        inscriptions = ord.find_envelopes(witness_stacks)
+        if index >= len(inscriptions):
+            return ResolvedInscription(inscription_id, error=f'the transaction has {len(inscriptions)} inscriptions')
+        inscription = inscriptions[index]
+        try:
+            body = b''.join(inscription.iter_decoded_chunks())
+        except Exception as e:  # Unsupported, corrupt or oversized encoded bodies
+            print(f"Could not decode {inscription_id}, using the encoded body: {e}")
+            body = bytes(inscription.body)
+        references = find_references(inscription.mime_type, body)
+        if inscription.delegate is not None and inscription.delegate not in references:
+            # A delegating inscription shows the content of its delegate
+            references.append(inscription.delegate)
+        return ResolvedInscription(inscription_id, inscription, inscription.mime_type, body, references)
+
+    def get(self, inscription_id, timeout_duration=10):
+        # Returns one inscription without following its references
+        return self._store.get(inscription_id, timeout_duration)
+
+    def resolve(self, inscription_id, timeout_duration=10):
+        # Resolves an inscription and everything it references
+        return self._resolve(self.get(inscription_id, timeout_duration), timeout_duration)
+
+    def resolve_content(self, mime_type, body, timeout_duration=10):
+        # Resolves the references of an already extracted body
+        return self._resolve(ResolvedInscription(None, None, mime_type, bytes(body), find_references(mime_type, body)),
+                             timeout_duration)
+
+    def _resolve(self, root, timeout_duration):
+        inscriptions = {root.inscription_id: root}
+        depths = {root.inscription_id: 0}
+        running = {}
+
+        def expand(resolved):
+            # Fetches the references of a resolved inscription that are within the depth
+            # limit. An inscription reached again over a shorter path is expanded again,
+            # references it had beyond the limit may be within it now.
+            depth = depths[resolved.inscription_id] + 1
+            for reference in resolved.references:
+                if reference in depths and depths[reference] <= depth:
+                    continue
+                depths[reference] = depth
+                if depth > self.max_depth:
+                    continue
+                if reference in inscriptions:
+                    expand(inscriptions[reference])
+                elif reference not in running.values():
+                    running[self._executor.submit(self.get, reference, timeout_duration)] = reference
+
+        expand(root)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                reference = running.pop(future)
+                try:
+                    resolved = future.result()
+                except Exception as e:
+                    resolved = ResolvedInscription(reference, error=f'{type(e).__name__}: {e}')
+                inscriptions[reference] = resolved
+                expand(resolved)
+
+        truncated = [inscription_id for inscription_id in depths if inscription_id not in inscriptions]
+        return Resolution(root, inscriptions, depths, find_cycles(inscriptions, root.inscription_id), truncated)
+
+def find_cycles(inscriptions, root_id):
+    # Depth-first search from the root, returns the edges pointing back to an
+    # inscription that is still on the search path
+    cycles = []
+    on_path = set()
+    finished = set()
+    stack = [(root_id, iter(inscriptions[root_id].references))]
+    on_path.add(root_id)
+    while stack:
+        inscription_id, references = stack[-1]
+        reference = next(references, None)
+        if reference is None:
+            stack.pop()
+            on_path.discard(inscription_id)
+            finished.add(inscription_id)
+        elif reference in on_path:
+            cycles.append((inscription_id, reference))
+        elif reference in inscriptions and reference not in finished:
+            on_path.add(reference)
+            stack.append((reference, iter(inscriptions[reference].references)))
+    return cycles
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve a recursive inscription and save it with everything it references.")
+    parser.add_argument('inscription_id', help="Inscription id, e.g. <txid>i0")
+    parser.add_argument('--output-dir', default=DEFAULT_STORE_DIR, help="Directory of the content store")
+    parser.add_argument('--max-depth', type=int, default=MAX_RECURSION_DEPTH)
+    args = parser.parse_args()
+
+    resolver = RecursiveResolver(max_depth=args.max_depth)
+    resolution = resolver.resolve(args.inscription_id)
+    resolver.close()
+    if resolution.root.error is not None:
+        print(f"Could not resolve {args.inscription_id}: {resolution.root.error}")
+        return 1
+
+    store = ContentStore(args.output_dir)
+    for resolved in [resolution.root] + resolution.dependencies:
+        indent = '  ' * resolution.depths[resolved.inscription_id]
+        if resolved.error is not None:
+            print(f"{indent}{resolved.inscription_id}: {resolved.error}")
+            continue
+        path = store.put_inscription(resolved.inscription, resolved.inscription_id)
+        print(f"{indent}{resolved.inscription_id} ({resolved.mime_type}) saved to {path}")
+    for inscription_id, reference in resolution.cycles:
+        print(f"Cycle: {inscription_id} references {reference}")
+    if resolution.truncated:
+        print(f"{len(resolution.truncated)} references are deeper than {args.max_depth} levels and were not resolved.")
+
+if __name__ == "__main__":
+    sys.exit(main())
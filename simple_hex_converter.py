@@ -1,14 +1,12 @@
-def hex_to_image(hex_string, output_file):
-    # Remove invalid characters
-    hex_string = ''.join(c for c in hex_string if c in '0123456789abcdefABCDEF')
+from hex_codec import decode_hex_tolerant
 
-    # Check if the string length is even
-    if len(hex_string) % 2 != 0:
-        print("Hex string length is odd. Cannot convert to binary.")
+def hex_to_image(hex_string, output_file):
+    # Convert hex string to bytes, ignoring invalid characters
+    try:
+        binary_data = decode_hex_tolerant(hex_string)
+    except ValueError as e:
+        print(e)
         return
-
-    # Convert hex string to bytes
-    binary_data = bytes(int(hex_string[i:i+2], 16) for i in range(0, len(hex_string), 2))
     print(binary_data)
     # Save binary data to a file
     with open(output_file, 'wb') as file:
@@ -16,7 +14,8 @@ def hex_to_image(hex_string, output_file):
 
     print(f"Image saved as {output_file}")
 
-# Example usage
-hex_string = "1fde1751d48935e70ca0e5013707ae8326a228506d867b1ec71163f41b5dbb2ce14d84e358849d3197230ae2a50002bab1d0abd1835310d6354154e2fc77befbfd2dd309562c753361fba5f41794cb170b182e96f674557e8daa90fca54e028564b2b91d71093272e9f7edc7af8a85622452b71afe9999fbe69c7d9858d3ddd99d41cc1a0d4224145a82da094d3c44dadf46b3e678b6a65842f0b0d2d23fec5bf228f7f7aaa922ec065105e03fda28651aa654e1d39b60cdc1d11c62a69ff4aeda9e039eae560a79a03951bc399db8b258b4eadd8450485559876eabd7d185e3aae480e04589857afb8ae13b421df7b5bc5eb0af6daadec1ce03cd887b2b5280a59eac62404ee421acf7c2df4b4f35c8367963f4702f410135f7b91d45d50f4feb4a052055d20a8a2ac37570cc41f48fce5b1d215b57454534c9b384ceb61244bdf767fdbdbf6f2fe7373b74e8797fffeb37eade9ddea597dfd40f08b556cfd65ccb0e1fee5db1b7d74bdd4f1d1843aeb83c99f724d7f93c3e02832733b5865d13243abcb005f86c370730d64338c75ccedd5b5865466ad35c427f60b6871cc71969c33b7e5920bfb1fb74422c3acb368c8003faa9f48e211035b73dc34cca39a3c0b22da985921ff8d0fc2c442c6258e9e18c2877a227e6c6f5baf9c0f9a1eacf0a625272812e1c7a2e888986c5205bac70b6292f386f86e3cbfa21997762f5ae70076a45662feeefc75d9d1b2f0664bdf6e6cd4e45b0f99798c8d4aec403c2f547f5714588c1bb08f364a38eff3541a8c1da812c437688b14f96832c0c6e8d509725adb993fb07dd8bab430eb4e429be21d0ace878530a91ef6621611c696963f2af3d7b89b098f215aca6c66866526f4bd61ccc4f14153fd0183c614111959f663040d279ca0d6f80e6b9572ee654d4372a8f41b03930531ebc4bbb60b93fe6e8d0a5518813b48a3d8ce8be041307770094f11e1a6c5fd934dee75eace03f8a5c5b180a18bfa4eb32ae1ae129b5e69b225eb01e655e34a8dd64e3f2ad787342632556245c529118fd18c4ca0d0adfabc94efc05827b998a68bd5964f5a25f3ca8a79e1a039bc823bba54feda74d6b13dd5211bfcbec1751206a8ff325a9336e1e5d1368177b2e92e111861a98c83db7ea6407b746bb421a22033fb02ba884d8aa27a8a95faff84b3998739d98366c1e6768e3a809a23fad82328f91129bdba8c8cc424efe9b982cfe76a50b8cd37e51eb7caabab952ca1b0f83f84a2b3a432f2d90f65d83fb19f9aaf29be55148bb8a839ea08a9392f66dcfe3a5b581cadc5e6e4315517da5e6882db6b5559d35fd3f3aa7c8e43d21ad1d278a3f3615c406ed0d871665ef5e86c61c481d67e79405c5f93221dd39f12807f42fb09bcaf1ca4a36b6284aa985bb44893c87ba549a1262cc53b529a584d41318b13f2862c13d10a314fd7b36a85d462561b41c67a9b5b60da371a00e9c2963a23224003899fe826702780ff7b594bec5e49366168ccc4e07e70722dd4c29a82264f0d8a93550d0858762441a964d7962ee120cb7218a9f21b7b07749230aeefd76bf92fa5b2f07ecdf47b5df62409f86aa8395b0ead4bd953b2ba4204b742ff39c103c194176738b94c08b672691cf929674170d65ae2c459773e557a0606b2cb76dee53ebe58fca0be8bd5fffd84a9b24ca01c042eebf506bf1073e635283bfcb72819de241f3d960c5deeceee34fda5f66de269fd5ee741639fbefd83c8752c575ce5c3bdf0be75019a5fa7928d3c7c150b22cccfae088d53915a1cc9c185e566eecdfc101b3f582c210e8f97955f9dbbf1a7fab1e7a362b26926974cdfbecc273b1e2f9483683c5cf10f2d9033fefff01bfaace2f0a65ba38593aa598d5c1936ad203"
-output_file = "output_image.py"  # Change the extension based on your image format
-hex_to_image(hex_string, output_file)
\ No newline at end of file
+if __name__ == "__main__":
+    # Example usage
+    hex_string = "1fde1751d48935e70ca0e5013707ae8326a228506d867b1ec71163f41b5dbb2ce14d84e358849d3197230ae2a50002bab1d0abd1835310d6354154e2fc77befbfd2dd309562c753361fba5f41794cb170b182e96f674557e8daa90fca54e028564b2b91d71093272e9f7edc7af8a85622452b71afe9999fbe69c7d9858d3ddd99d41cc1a0d4224145a82da094d3c44dadf46b3e678b6a65842f0b0d2d23fec5bf228f7f7aaa922ec065105e03fda28651aa654e1d39b60cdc1d11c62a69ff4aeda9e039eae560a79a03951bc399db8b258b4eadd8450485559876eabd7d185e3aae480e04589857afb8ae13b421df7b5bc5eb0af6daadec1ce03cd887b2b5280a59eac62404ee421acf7c2df4b4f35c8367963f4702f410135f7b91d45d50f4feb4a052055d20a8a2ac37570cc41f48fce5b1d215b57454534c9b384ceb61244bdf767fdbdbf6f2fe7373b74e8797fffeb37eade9ddea597dfd40f08b556cfd65ccb0e1fee5db1b7d74bdd4f1d1843aeb83c99f724d7f93c3e02832733b5865d13243abcb005f86c370730d64338c75ccedd5b5865466ad35c427f60b6871cc71969c33b7e5920bfb1fb74422c3acb368c8003faa9f48e211035b73dc34cca39a3c0b22da985921ff8d0fc2c442c6258e9e18c2877a227e6c6f5baf9c0f9a1eacf0a625272812e1c7a2e888986c5205bac70b6292f386f86e3cbfa21997762f5ae70076a45662feeefc75d9d1b2f0664bdf6e6cd4e45b0f99798c8d4aec403c2f547f5714588c1bb08f364a38eff3541a8c1da812c437688b14f96832c0c6e8d509725adb993fb07dd8bab430eb4e429be21d0ace878530a91ef6621611c696963f2af3d7b89b098f215aca6c66866526f4bd61ccc4f14153fd0183c614111959f663040d279ca0d6f80e6b9572ee654d4372a8f41b03930531ebc4bbb60b93fe6e8d0a5518813b48a3d8ce8be041307770094f11e1a6c5fd934dee75eace03f8a5c5b180a18bfa4eb32ae1ae129b5e69b225eb01e655e34a8dd64e3f2ad787342632556245c529118fd18c4ca0d0adfabc94efc05827b998a68bd5964f5a25f3ca8a79e1a039bc823bba54feda74d6b13dd5211bfcbec1751206a8ff325a9336e1e5d1368177b2e92e111861a98c83db7ea6407b746bb421a22033fb02ba884d8aa27a8a95faff84b3998739d98366c1e6768e3a809a23fad82328f91129bdba8c8cc424efe9b982cfe76a50b8cd37e51eb7caabab952ca1b0f83f84a2b3a432f2d90f65d83fb19f9aaf29be55148bb8a839ea08a9392f66dcfe3a5b581cadc5e6e4315517da5e6882db6b5559d35fd3f3aa7c8e43d21ad1d278a3f3615c406ed0d871665ef5e86c61c481d67e79405c5f93221dd39f12807f42fb09bcaf1ca4a36b6284aa985bb44893c87ba549a1262cc53b529a584d41318b13f2862c13d10a314fd7b36a85d462561b41c67a9b5b60da371a00e9c2963a23224003899fe826702780ff7b594bec5e49366168ccc4e07e70722dd4c29a82264f0d8a93550d0858762441a964d7962ee120cb7218a9f21b7b07749230aeefd76bf92fa5b2f07ecdf47b5df62409f86aa8395b0ead4bd953b2ba4204b742ff39c103c194176738b94c08b672691cf929674170d65ae2c459773e557a0606b2cb76dee53ebe58fca0be8bd5fffd84a9b24ca01c042eebf506bf1073e635283bfcb72819de241f3d960c5deeceee34fda5f66de269fd5ee741639fbefd83c8752c575ce5c3bdf0be75019a5fa7928d3c7c150b22cccfae088d53915a1cc9c185e566eecdfc101b3f582c210e8f97955f9dbbf1a7fab1e7a362b26926974cdfbecc273b1e2f9483683c5cf10f2d9033fefff01bfaace2f0a65ba38593aa598d5c1936ad203"
+    output_file = "output_image.py"  # Change the extension based on your image format
+    hex_to_image(hex_string, output_file)
\ No newline at end of file
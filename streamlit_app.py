@@ -1,18 +1,125 @@
+import bisect
+import html
 import requests
 import streamlit as st
 from annotated_text import annotated_text
 import streamlit.components.v1 as components
 import pandas as pd
 import ordinals_parser as ord
+import metrics
+from hex_codec import decode_hex
+from recursive_resolver import RecursiveResolver
+
+# Maximum number of entries kept by each of the data caches below
+CACHE_MAX_ENTRIES = 128
+
+####################################################################################################################################
+### Data Layer                                                                                                                   ###
+####################################################################################################################################
+# Streamlit reruns this whole script on every widget interaction. Everything that touches the network or parses
+# witness data goes through these cached functions so a rerun only renders.
+
+class _NotCacheable(Exception):
+    # Raised from a cached function to hand back a value without caching it (Streamlit never caches exceptions)
+    def __init__(self, value):
+        self.value = value
+
+@st.cache_resource
+def get_client():
+    # One client, with its connection pools and transaction store, shared by all sessions
+    return ord.get_client()
+
+@st.cache_data(ttl="1d", max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def fetch_tweet_html(url):
+    # Use Twitter's oEmbed API
+    # https://dev.twitter.com/web/embedded-tweets
+    api = "https://publish.twitter.com/oembed?url={}".format(url)
+    response = requests.get(api)
+    return response.json()["html"]
+
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _load_confirmed_transaction(tx_id):
+    # Confirmed transactions never change, so they are cached without a TTL. cache_resource hands out the
+    # cached object itself instead of a copy, so callers must not modify it.
+    tx = get_client().get_full_transaction(tx_id)
+    if tx is None or not ord.is_confirmed(tx):
+        raise _NotCacheable(tx)
+    return tx
+
+def load_transaction(tx_id):
+    try:
+        return _load_confirmed_transaction(tx_id)
+    except _NotCacheable as e:
+        return e.value
+
+class WitnessView(object):
+    # The decoded witness of a transaction with its annotation and inscription, everything the page needs to
+    # render it. Shared by all sessions through cache_resource, so it is read-only.
+    # body is the content with its content encoding removed, raw_body the bytes as they are pushed in the
+    # envelope, which the hex viewer shows chunk by chunk.
+    __slots__ = ('data', 'spans', 'span_starts', 'chunk_offsets', 'mime_type', 'body', 'raw_body', 'body_chunk_offsets')
+
+    def __init__(self, witness_data):
+        self.data = decode_hex(witness_data)
+        self.spans = ord.annotate_envelopes(self.data)
+        self.span_starts = [start for start, _, _ in self.spans]
+        self.chunk_offsets = []
+        self.mime_type = None
+        self.body = b''
+        self.raw_body = b''
+        self.body_chunk_offsets = []
+        inscription = ord.parse_envelope(self.data)
+        if inscription is not None:
+            self.chunk_offsets = [start for start, _ in inscription.chunks]
+            self.mime_type = inscription.mime_type
+            self.raw_body = inscription.body
+            try:
+                self.body = b''.join(inscription.iter_decoded_chunks())
+            except Exception as e:  # Unsupported, corrupt or oversized encoded bodies
+                print(f"Could not decode the inscription content: {e}")
+                self.body = self.raw_body
+            position = 0
+            for start, end in inscription.chunks:
+                self.body_chunk_offsets.append(position)
+                position += end - start
+
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _load_witness_view(tx_id):
+    tx = load_transaction(tx_id)
+    if tx is None:
+        raise _NotCacheable(None)
+    return WitnessView(ord.witness_data_from_transaction(tx))
+
+def load_witness_view(tx_id):
+    try:
+        return _load_witness_view(tx_id)
+    except _NotCacheable as e:
+        return e.value
+
+@st.cache_resource
+def get_resolver():
+    # Shared by all sessions, so libraries used by many recursive inscriptions are fetched once
+    return RecursiveResolver(get_client())
+
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _inline_recursive_content(mime_type, body):
+    resolution = get_resolver().resolve_content(mime_type, body)
+    if resolution.failed:
+        raise _NotCacheable(resolution.inline())
+    return resolution.inline()
+
+def inline_recursive_content(mime_type, body):
+    # The body with every /content/<inscription id> reference replaced by the referenced content.
+    # Results with references that could not be fetched are not cached, they are retried on the next run.
+    try:
+        return _inline_recursive_content(mime_type, body)
+    except _NotCacheable as e:
+        return e.value
 
 class Tweet(object):
     def __init__(self, s, embed_str=False):
         if not embed_str:
-            # Use Twitter's oEmbed API
-            # https://dev.twitter.com/web/embedded-tweets
-            api = "https://publish.twitter.com/oembed?url={}".format(s)
-            response = requests.get(api)
-            self.text = response.json()["html"]
+            self.text = fetch_tweet_html(s)
         else:
             self.text = s
 
@@ -22,114 +129,100 @@ class Tweet(object):
     def component(self):
         return components.html(self.text, height=1100)
 
-def display_inscription_data(mime_type, hex_string):
-    # Convert hex string to bytes
-    binary_data = bytes(int(hex_string[i:i+2], 16) for i in range(0, len(hex_string), 2))
-
-    if mime_type.startswith('image/'):
-        st.image(binary_data)
-    elif mime_type.startswith('audio/'):
-        st.audio(binary_data)
-    elif mime_type.startswith('video/'):
-        st.video(binary_data)
-    else:
-        st.text(binary_data.decode())
-
-def annotate_envelope_and_inscription(hex_string):
-    # Define the envelope format and opcodes in hex
-    opcodes = {
-        '00': 'OP_FALSE',
-        '63': 'OP_IF',
-        '036f7264': 'OP_PUSH "ord"',
-        '0101': 'OP_PUSH 1',
-        '00': 'OP_PUSH 0',
-        '4c': 'OP_PUSHDATA1',
-        '4d': 'OP_PUSHDATA2',
-        '4e': 'OP_PUSHDATA4',
-        '68': 'OP_ENDIF'
-    }
-
-    envelope_start_seq = '00' + '63' + '036f7264' + '0101'
-    start_index = hex_string.find(envelope_start_seq)
-
-    if start_index == -1:
-        print("Envelope start sequence not found.")
-        return []
-
-    annotated = []
-    last_was_data_chunk = False
-    is_first_00 = True
-
-    # Include the part of the string before the envelope start sequence
-    if start_index > 0:
-        annotated.append(hex_string[:start_index])
-
-    i = start_index
-
-    while i < len(hex_string):
-        matched_opcode = None
-        for code, name in opcodes.items():
-            code_len = len(code)
-            if hex_string[i:i+code_len] == code:
-                matched_opcode = code
-                if code == '00' and is_first_00: # First 00 is OP_FALSE, following 00s are OP_PUSH 0
-                    is_first_00 = False
-                    annotated.append((hex_string[i:i+code_len], 'OP_FALSE'))
-                    i += code_len
-                else:
-                  annotated.append((hex_string[i:i+code_len], name))
-                  i += code_len
-
-                # Check for OP_ENDIF following a data chunk or direct push
-                if code == '68' and last_was_data_chunk:
-                    return annotated
-                last_was_data_chunk = False
-                break
-
-        # Check for direct push opcodes (1-75 bytes)
-        if not matched_opcode and '01' <= hex_string[i:i+2] <= '4b':
-            opcode_hex = hex_string[i:i+2]
-            chunk_length = int(opcode_hex, 16) * 2  # Convert to number of characters
-            chunk_start = i + 2
-            chunk_end = chunk_start + chunk_length
-            annotated.append((hex_string[chunk_start:chunk_end], f'Direct Data Push: {chunk_length // 2} bytes'))
-            i = chunk_end
-            last_was_data_chunk = True
-            continue
-        
-        # Handle MIME type extraction and data chunk annotation
-        if matched_opcode and matched_opcode == '0101':
-                # Extract MIME type after OP_1
-                mime_type_length_hex = hex_string[i:i+2]
-                mime_type_length = int(mime_type_length_hex, 16) * 2
-                mime_type_start = i + 2
-                mime_type_end = mime_type_start + mime_type_length
-                mime_type_hex = hex_string[mime_type_start:mime_type_end]
-                mime_type = bytes.fromhex(mime_type_hex).decode('ascii')
-                annotated.append((mime_type_hex, f'MIME Type: "{mime_type}"'))
-                i = mime_type_end
-        
-        if matched_opcode and matched_opcode in ['4c', '4d', '4e']:
-            # Calculate data chunk length for PUSHDATA opcodes
-            length_bytes = 2 if matched_opcode == '4c' else 4 if matched_opcode == '4d' else 8
-            chunk_length_hex = hex_string[i:i+length_bytes]
-            chunk_length = int.from_bytes(bytes.fromhex(chunk_length_hex), 'little')
-            annotated.append((chunk_length_hex, f'Data Length: {chunk_length} bytes'))
-
-            # Calculate the actual start and end of the data chunk
-            chunk_start = i + length_bytes
-            chunk_end = chunk_start + chunk_length * 2
-            annotated.append((hex_string[chunk_start:chunk_end], 'Data Chunk'))
-            i = chunk_end
-            last_was_data_chunk = True
-            continue
-
-        if not matched_opcode:
-            # If no opcode is matched, increment by 2 (smallest opcode length)
-            annotated.append(hex_string[i:i+2])
-            i += 2
-
-    return annotated
+def display_sandboxed_preview(document, height=600):
+    # Inscriptions are untrusted, and Streamlit's component iframe shares the app's origin. The document is
+    # rendered in a nested iframe without allow-same-origin, so its scripts run in an opaque origin and
+    # cannot reach the app.
+    components.html(f'<iframe sandbox="allow-scripts" srcdoc="{html.escape(document, quote=True)}" '
+                    f'style="width: 100%; height: {height - 20}px; border: 0"></iframe>', height=height)
+
+def display_inscription_data(mime_type, binary_data):
+    mime_type = mime_type or ''  # Inscriptions without a content type are shown as text
+    with metrics.timer('stage_seconds', stage='render', view='content'):
+        if mime_type.startswith(('text/html', 'image/svg')):
+            st.text(binary_data.decode(errors='replace'))
+            # Recursive inscriptions load other inscriptions, which are fetched and embedded before rendering
+            display_sandboxed_preview(inline_recursive_content(mime_type, binary_data).decode(errors='replace'))
+        elif mime_type.startswith('image/'):
+            st.image(binary_data)
+        elif mime_type.startswith('audio/'):
+            st.audio(binary_data)
+        elif mime_type.startswith('video/'):
+            st.video(binary_data)
+        else:
+            st.text(binary_data.decode(errors='replace'))
+    metrics.increment('stage_bytes_total', len(binary_data), stage='render', direction='out')
+
+# Witness items longer than this are shortened in the JSON view, the viewers show the complete witness
+JSON_WITNESS_PREVIEW_LENGTH = 200
+
+def shorten_witness_for_display(tx):
+    # Returns a copy of the transaction with long witness items cut short. Only the
+    # input dicts are copied, the witness strings are sliced, not re-encoded.
+    vin = []
+    for tx_input in tx.get('vin', []):
+        tx_input = dict(tx_input)
+        for field in ('witness', 'txinwitness'):
+            if field in tx_input:
+                tx_input[field] = [item if len(item) <= JSON_WITNESS_PREVIEW_LENGTH else
+                                   f"{item[:JSON_WITNESS_PREVIEW_LENGTH]}... ({len(item) - JSON_WITNESS_PREVIEW_LENGTH:,} more characters)"
+                                   for item in tx_input[field]]
+        vin.append(tx_input)
+    return dict(tx, vin=vin)
+
+# Number of bytes shown on one page of a paged viewer
+VIEWER_PAGE_SIZE = 2048
+
+def _set_viewer_offset(key, offset):
+    st.session_state[f"{key}_offset"] = offset
+
+def _jump_to_chunk(key, chunk_offsets):
+    chunk = st.session_state[f"{key}_chunk"]
+    if chunk is not None:
+        _set_viewer_offset(key, chunk_offsets[chunk])
+
+def paged_viewer(label, data, key, spans=None, span_starts=None, chunk_offsets=None):
+    # Renders one page of data in hex, annotated when spans (with their sorted span_starts) are given. Only the
+    # current page is sliced from the cached buffer and sent to the browser, whatever the size of data.
+    total = len(data)
+    st.markdown(f"**{label}**")
+    if total == 0:
+        st.caption("No data to display.")
+        return
+
+    offset_key = f"{key}_offset"
+    last_page_offset = (total - 1) // VIEWER_PAGE_SIZE * VIEWER_PAGE_SIZE
+    # A new transaction may be shorter than the offset left over from the previous one
+    st.session_state[offset_key] = min(st.session_state.get(offset_key, 0), total - 1)
+    offset = st.session_state[offset_key]
+
+    previous_column, next_column, offset_column, chunk_column = st.columns([1, 1, 2, 2])
+    previous_column.button("Previous", key=f"{key}_previous", disabled=offset == 0,
+                           on_click=_set_viewer_offset, args=(key, max(0, offset - VIEWER_PAGE_SIZE)))
+    next_column.button("Next", key=f"{key}_next", disabled=offset >= last_page_offset,
+                       on_click=_set_viewer_offset, args=(key, min(offset + VIEWER_PAGE_SIZE, last_page_offset)))
+    offset_column.number_input("Byte offset", min_value=0, max_value=total - 1, step=VIEWER_PAGE_SIZE, key=offset_key)
+    if chunk_offsets:
+        chunk_column.selectbox("Jump to chunk", range(len(chunk_offsets)), index=None, key=f"{key}_chunk",
+                               format_func=lambda chunk: f"Chunk {chunk + 1} (byte {chunk_offsets[chunk]:,})",
+                               on_change=_jump_to_chunk, args=(key, chunk_offsets))
+
+    start = st.session_state[offset_key]
+    end = min(start + VIEWER_PAGE_SIZE, total)
+    with metrics.timer('stage_seconds', stage='render', view=key):
+        if spans is None:
+            st.text_area(label, data[start:end].hex(), height=300, label_visibility="collapsed")
+        else:
+            # Spans partly on the page are cut at the page boundaries
+            page = []
+            for span_start, span_end, span_label in spans[bisect.bisect_right(span_starts, start) - 1:]:
+                if span_start >= end:
+                    break
+                text = data[max(span_start, start):min(span_end, end)].hex()
+                page.append(text if span_label is None else (text, span_label))
+            annotated_text(page)
+    metrics.increment('stage_bytes_total', end - start, stage='render', direction='out')
+    st.caption(f"Showing bytes {start:,} to {end:,} of {total:,} (page {start // VIEWER_PAGE_SIZE + 1} of {last_page_offset // VIEWER_PAGE_SIZE + 1}).")
 
 ####################################################################################################################################
 ### Title and Intro                                                                                                              ###
@@ -146,7 +239,7 @@ st.write("Inscriptions inscribe sats with arbitrary content, creating bitcoin-na
 
 st.write("For the sake of simplicity, this demo connects to publicly available APIs to retrieve the inscription data (i.e. a public bitcoin node). However, this process works exactly the same on your own Bitcoin node.")
 
-st.write("This demo is set up to work with the [Taproot Wizards](https://taprootwizards.com/collection) collection. However, it does support almost any other inscriptions as well, except for recursive inscriptions. If you want to explore other inscriptions, \
+st.write("This demo is set up to work with the [Taproot Wizards](https://taprootwizards.com/collection) collection. However, it does support almost any other inscriptions as well, including recursive inscriptions. If you want to explore other inscriptions, \
          you can paste a transaction ID into the text field further down on this website. You can explore other inscriptions on ordinals explorers like [ord.io](https://www.ord.io).")
 
 st.write("Due to the large amount of data displayed on this website, it is best viewed on a desktop computer.")
@@ -205,20 +298,24 @@ st.write("We are using a public API to retrieve the transaction data. If we were
 tx_id = st.text_input('Transcation ID', 'ef207ae72e81c068142ab6ea03f2549e8c6edb2e96050ae1616b65ce3347d1ed')
 st.caption('Here you can paste the transaction ID from above. The transaction ID from the transaction that inscribed our doge wizard is already filled in. But you can also paste any other transaction ID from your favorite wizard here.')
 
-full_txs = ord.get_full_transaction_from_tx_id(tx_id)
-witness_data = ord.get_witness_data_from_tx_id(tx_id)
+full_txs = load_transaction(tx_id)
+if full_txs is None:
+    st.error("Could not retrieve the transaction. Please check the transaction ID and try again.")
+    st.stop()
+witness_view = load_witness_view(tx_id)
 
 st.markdown("The following is the full transaction in JSON format. It shows all the different parts of the transaction. It would take too much time to explain all these different parts. Luckily the \
          [Ordinal Theory Handbook](https://docs.ordinals.com/guides/inscriptions.html) tells us that 'inscription content is included in transaction witnesses [...]'. We can find the witness data in \
          the JSON below by unfolding the JSON until we find the `witness` object. I recommend to explore the JSON a bit yourself. Try to find the \
             witness data. Afterwards fold the JSON again to make the rest of the website more readable. Click on the little green arrow below to unfold the JSON.")
 
-st.json(full_txs, expanded=False)
-st.caption('This is the complete transaction in JSON format which we retrieved from the public API')
+st.json(shorten_witness_for_display(full_txs), expanded=False)
+st.caption('This is the complete transaction in JSON format which we retrieved from the public API. Long witness items are shortened here, you will find them in full further below.')
 
-st.write("For better readability, the witness data is extracted below and displayed in a separate text area. You can check that the witness data is the same as in the JSON above.")
+st.write("For better readability, the witness data is extracted below and displayed in a separate text area. You can check that the witness data is the same as in the JSON above. \
+         The witness data can be very long, so it is shown one page at a time. Use the buttons or enter a byte offset to move through it.")
 
-st.text_area("Witness Data: This data is in hexadecimal format. This has the inscription encoded (believe me).", witness_data, height=400)
+paged_viewer("Witness Data: This data is in hexadecimal format. This has the inscription encoded (believe me).", witness_view.data, key="witness")
 
 st.write("Ok, so WTF is this? This is just a lot of mubmo jumbo. How are we supposed to find our wizard in this? Let's take a closer look at the witness data. I promise you, the wizard is in there somewhere.")
 st.write("To continue, we need some more information about how the wizard is encoded in the witness data. First of all, the witness data is encoded using [hexadecimal](https://en.wikipedia.org/wiki/Hexadecimal) values. \
@@ -321,8 +418,8 @@ st.caption("We are literally just connecting the hexadecimal values of the opcod
 
 
 st.subheader("Parsing the Witness Data")
-st.markdown("Now that we have our start sequence, we can find it in the witness data. The annotation below shows the first 1500 characters of the witness data (for better readability and faster loading, the full \
-            witness data is a lot longer and depends on the size of the data that is inscribed).\
+st.markdown("Now that we have our start sequence, we can find it in the witness data. The annotation below covers the complete witness data (its length \
+            depends on the size of the data that is inscribed).\
          We can see that after the first few lines, the witness data starts with the \
          envelope start sequence: `OP_FALSE` (00), followed by `OP_IF` (63), followed by `OP_PUSH 'ord'` (036f7264), followed by `OP_PUSH 1` (0101)  After the `OP_PUSH 1` opcode, we can the see opcode that defines \
             the MIME type of the inscription. In the case of our wizard this will say 'image/webp' and defines how to interpret the data. After that we get the `OP_PUSH 0` code. This code indicates that now the actual \
@@ -332,13 +429,12 @@ st.markdown("Now that we have our start sequence, we can find it in the witness
             which converts to 520 in decimal values. This means that the next 520 bytes will be actual inscription data. As 1 byte needs two characters in hexadecimal this means that literally the next 1040 characters in the \
             witness data are part of the actual wizard image. You can check all the opcodes and lengths in the annotation below. This pattern is repeated until the end of \
          the inscription data. The inscription data is then followed by the `OP_ENDIF` opcode. 520 bytes is the largest number of bytes a standard tx can push onto the stack at once. Ord splits its inscriptions \
-         up into 520 byte pieces like this. You can see the first 520 byte chunk below, followed by the second one. There are a lot more chunks after that which we will not display here. After the last chunk \
-         we would find the `OP_ENDIF` opcode.")
+         up into 520 byte pieces like this. You can see every 520 byte chunk below, and right after the last chunk \
+         you will find the `OP_ENDIF` opcode.")
 
-witness_data_first_1500 = witness_data[:1500]
-annotated = annotate_envelope_and_inscription(witness_data_first_1500)
-annotated_text(annotated)
-st.caption("This is an annotation of the first 1500 characters of the witness data.")
+paged_viewer("Annotated Witness Data", witness_view.data, key="annotated", spans=witness_view.spans,
+             span_starts=witness_view.span_starts, chunk_offsets=witness_view.chunk_offsets)
+st.caption("This is an annotation of the complete witness data. You can jump straight to any of the data chunks.")
 
 st.subheader("So where is the wizard now?")
 st.write("So where is the wizard now, you might ask? Well, it is in all these data chunks. If we literally copy all these individual data chunks and concatenate them, we will get the wizard image encoded in hexadecimal format. \
@@ -351,14 +447,16 @@ st.write("So where is the wizard now, you might ask? Well, it is in all these da
 st.divider()  # Draws a horizontal rule
 
 st.header("Wizard, Come Out, Wherever You Are")
-st.write("In our example above we only displayed the first two chunks of data that make up our wizard. In the actual transaction the witness data is a lot longer and has many of these data chunks. \
+st.write("In our example above we saw all the individual chunks of data that make up our wizard. \
          To make things easier this application extracted all the individual chunks exactly in the same way as you can see in the annotation. Below you find a text field with exactly all this data concatenated. \
          You can check the first lines of the data against the annotation above. I promise you it is literally the same data. The last step is to convert this large string of text into byte data and display it as an image.  \
          Below you can see the result of that. And to proof that I am not just loading a random image into this website, please copy and paste the text into a random hex to image converter below.")
 
-mime_type, inscription = ord.find_envelope_and_inscription(witness_data)
-
-st.text_area("All the inscription data concatenated. You can paste this data into any hex to image converter.", inscription, height=400)
+paged_viewer("All the inscription data concatenated. You can paste this data into any hex to image converter.", witness_view.raw_body,
+             key="inscription", chunk_offsets=witness_view.body_chunk_offsets)
+if witness_view.body:
+    st.download_button("Download the inscription as a file", witness_view.body,
+                       file_name=f"inscription.{ord.mime_type_to_extension(witness_view.mime_type)}")
 
 st.write("I have loaded a random hex to image converter below. You can copy and paste the text from the text area above into this converter to see the wizard image. You can also search for other hex to image converters \
          on Google.")
@@ -369,8 +467,8 @@ st.write("As you can see the image is literally on the blockchain. It is just en
 st.divider()  # Draws a horizontal rule
 
 st.header("The Wizard (Inscription)")
-if inscription:
-  display_inscription_data(mime_type, inscription)
+if witness_view.body:
+  display_inscription_data(witness_view.mime_type, witness_view.body)
 
 st.write("And this my fellow wizards is how Taproot Wizards are literally stored on the Bitcoin blockchain forever. As long as a node is running, the wizard will be there. \
          If that isn't magic, I don't know what is.")
@@ -379,10 +477,10 @@ st.divider()  # Draws a horizontal rule
 
 st.header("How To Use This Tool")
 st.write("This application is meant to be an educational tool to help you understand how inscriptions are stored on the Bitcoin blockchain. It uses the doge wizard as an example inscription. However, the tool technically \
-         works with all inscriptions as long as they are text, image, video, or audio based. Recursive inscriptions are not yet supported. You can scroll up to the text field for the transaction ID, paste any other \
+         works with all inscriptions as long as they are text, image, video, audio, HTML or SVG based. Recursive inscriptions, which load other inscriptions, are shown together with the \
+         inscriptions they reference. You can scroll up to the text field for the transaction ID, paste any other \
          transaction ID for an inscription you would like to explore and hit enter. Keep in mind that the application might break due to the different formats of inscriptions. If you encounter problems or just want to leave a like, please \
          hit me up on X ([@you_are_el](https://twitter.com/you_are_el)).")
-st.write("Recursive inscriptions are not yet supported.")
 
 st.divider()  # Draws a horizontal rule
 
@@ -0,0 +1,148 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+import ordinals_parser as ord
+import chain_follower
+from chain_follower import ChainFollower
+
+def make_block(previous_hash, nonce):
+    # Header linked to previous_hash followed by an empty transaction list
+    header = (struct.pack('<I', 1) + bytes.fromhex(previous_hash)[::-1] + bytes(32)
+              + struct.pack('<III', 0, 0, nonce))
+    return header + b'\x00'
+
+class FakeNode(object):
+    # Stand-in node serving a chain of empty blocks. Forks are made by replacing the
+    # blocks above a height with a new branch.
+    def __init__(self, length):
+        self.blocks = {}
+        self.hashes = []
+        self.nonce = 0
+        self.extend(length)
+
+    def extend(self, count):
+        for _ in range(count):
+            previous_hash = self.hashes[-1] if self.hashes else '00' * 32
+            self.nonce += 1
+            raw_block = make_block(previous_hash, self.nonce)
+            block_hash = ord.block_hash_from_header(raw_block)
+            self.blocks[block_hash] = raw_block
+            self.hashes.append(block_hash)
+
+    def fork(self, height, count):
+        # Replaces every block from height on with count new blocks
+        del self.hashes[height:]
+        self.extend(count)
+
+    def get_tip_height(self, timeout_duration):
+        return len(self.hashes) - 1
+
+    def get_block_hash(self, height, timeout_duration):
+        return self.hashes[height] if 0 <= height < len(self.hashes) else None
+
+    def get_raw_block(self, block_hash, timeout_duration):
+        return self.blocks.get(block_hash)
+
+class ChainFollowerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.directory.name, 'checkpoint.json')
+        self.node = FakeNode(10)
+        self.processed = []
+        self.rolled_back = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def follower(self):
+        return ChainFollower(lambda height, block_hash, raw_block: self.processed.append((height, block_hash)),
+                             lambda height, block_hash: self.rolled_back.append((height, block_hash)),
+                             self.checkpoint_path, start_height=0, client=self.node)
+
+    def assert_on_best_chain(self, follower):
+        self.assertEqual(follower.blocks, [[height, self.node.hashes[height]]
+                                           for height in range(follower.blocks[0][0], len(self.node.hashes))])
+
+    def test_catches_up_to_the_tip(self):
+        follower = self.follower()
+        self.assertEqual(follower.poll(), 10)
+        self.assertEqual(self.processed, list(enumerate(self.node.hashes)))
+        self.assertEqual(follower.poll(), 0)
+        self.assert_on_best_chain(follower)
+
+    def test_longer_fork(self):
+        follower = self.follower()
+        follower.poll()
+        replaced = self.node.hashes[7:]
+        self.node.fork(7, 5)
+        self.processed.clear()
+
+        self.assertEqual(follower.poll(), 5)
+        self.assertEqual(self.rolled_back, [(height, replaced[height - 7]) for height in (9, 8, 7)])
+        self.assertEqual(self.processed, [(height, self.node.hashes[height]) for height in range(7, 12)])
+        self.assert_on_best_chain(follower)
+
+    def test_shorter_fork(self):
+        follower = self.follower()
+        follower.poll()
+        replaced = self.node.hashes[6:]
+        self.node.fork(6, 2)
+        self.processed.clear()
+
+        self.assertEqual(follower.poll(), 2)
+        self.assertEqual(self.rolled_back, [(height, replaced[height - 6]) for height in (9, 8, 7, 6)])
+        self.assertEqual(self.processed, [(6, self.node.hashes[6]), (7, self.node.hashes[7])])
+        self.assert_on_best_chain(follower)
+
+    def test_restart_from_checkpoint(self):
+        self.follower().poll()
+        self.node.fork(8, 4)
+        self.processed.clear()
+
+        follower = self.follower()
+        self.assertEqual(follower.height, 9)
+        self.assertEqual(follower.poll(), 4)
+        self.assertEqual([height for height, _ in self.rolled_back], [9, 8])
+        self.assertEqual([height for height, _ in self.processed], [8, 9, 10, 11])
+        self.assert_on_best_chain(follower)
+
+    def test_reorg_while_catching_up(self):
+        follower = self.follower()
+        follower.poll()
+        self.node.extend(3)
+        get_block_hash = self.node.get_block_hash
+
+        def fork_before_block_10(height, timeout_duration):
+            # The chain is reorganized after block 9 was checked, while catching up
+            if height == 10:
+                self.node.get_block_hash = get_block_hash
+                self.node.fork(9, 5)
+            return get_block_hash(height, timeout_duration)
+        self.node.get_block_hash = fork_before_block_10
+        self.processed.clear()
+
+        follower.poll()
+        follower.poll()
+        self.assertEqual([height for height, _ in self.rolled_back], [9])
+        self.assertEqual([height for height, _ in self.processed], [9, 10, 11, 12, 13])
+        self.assert_on_best_chain(follower)
+
+    def test_reorg_deeper_than_checkpoint(self):
+        with mock.patch.object(chain_follower, 'CHECKPOINT_DEPTH', 3):
+            follower = self.follower()
+            follower.poll()
+            self.assertEqual([height for height, _ in follower.blocks], [7, 8, 9])
+            self.node.fork(2, 10)
+            self.processed.clear()
+
+            self.assertEqual(follower.poll(), 5)
+        # Every checkpointed block was rolled back and processing resumed from the
+        # oldest of them, the blocks below it are not reprocessed
+        self.assertEqual([height for height, _ in self.rolled_back], [9, 8, 7])
+        self.assertEqual(self.processed, [(height, self.node.hashes[height]) for height in range(7, 12)])
+        self.assertEqual(follower.blocks[-1], [11, self.node.hashes[11]])
+
+if __name__ == '__main__':
+    unittest.main()
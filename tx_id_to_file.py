@@ -1,26 +1,225 @@
+import os
+import re
 import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import ordinals_parser as ord
+from content_store import ContentStore, DEFAULT_STORE_DIR
+from recursive_resolver import RecursiveResolver, can_reference
 
-def main():
+# Results of batch runs, one JSON line per transaction
+DEFAULT_MANIFEST_FILE = 'tx_id_to_file_manifest.jsonl'
+
+# Manifest statuses that count as done when resuming, errors are retried
+_FINISHED_STATUSES = ('ok', 'no_inscription')
+
+# A txid is 32 bytes in hex. Anything else would end up in file names and URL paths.
+_TX_ID_PATTERN = re.compile(r'[0-9a-fA-F]{64}')
+
+# Width of the progress bar in characters
+PROGRESS_BAR_WIDTH = 30
+
+def is_tx_id(value):
+    return _TX_ID_PATTERN.fullmatch(value) is not None
+
+def extract_transaction(tx_id, raw_tx, store_root=DEFAULT_STORE_DIR):
+    # Parses a serialized transaction and stores every inscription in it as
+    # <txid>i<n>.<ext>. Returns one dict per stored inscription.
+    store = ContentStore(store_root)
+    transaction = ord.deserialize_transaction(raw_tx)
+    files = []
+    for index, inscription in enumerate(ord.find_envelopes(tx_input.witness for tx_input in transaction.inputs)):
+        path = store.put_inscription(inscription, f"{tx_id}i{index}")
+        files.append({'path': path, 'mime_type': inscription.mime_type, 'size': os.path.getsize(path)})
+    return files
+
+def interactive(store_root=DEFAULT_STORE_DIR):
     print("Welcome to the Bitcoin Transaction to Inscription Converter.")
     print("This program extracts witness data from a Bitcoin transaction and saves the inscription to a file.")
-    print("It supports almost any file types (images, videos, text, etc.) but does not support recursive inscriptions.")
-    transaction_id = input("Please enter the transaction ID of the inscription you would like to save: ")
+    print("It supports almost any file types (images, videos, text, etc.). Inscriptions referenced by recursive inscriptions are saved as well.")
+    transaction_id = input("Please enter the transaction ID of the inscription you would like to save: ").strip()
+    if not is_tx_id(transaction_id):
+        print("Invalid transaction ID. It has to be 64 hexadecimal characters.")
+        return
+    transaction_id = transaction_id.lower()
 
+    raw_tx = ord.get_raw_transaction_from_tx_id(transaction_id)
+    if raw_tx is None:
+        print("Could not retrieve transaction data.")
+        return
     try:
-        witness_data = ord.get_witness_data_from_tx_id(transaction_id)
-        mime_type, inscription = ord.find_envelope_and_inscription(witness_data)
-        if inscription:
-            output_file = "inscription"  # Base name for the output file
-            extension = ord.mime_type_to_extension(mime_type)
-            output_file_with_extension = f"{output_file}.{extension}"
-            print(f"MIME Type: {mime_type}")
-            ord.inscription_data_to_file(mime_type, inscription, output_file)
-            print(f"Inscription saved to {output_file_with_extension}")
-        else:
-            print("No inscription found in the provided transaction ID.")
+        files = extract_transaction(transaction_id, raw_tx, store_root)
     except Exception as e:
-        print(f"Could not retrieve transaction data.")
+        print(f"Could not extract the inscription: {type(e).__name__}: {e}")
+        return
+    if not files:
+        print("No inscription found in the provided transaction ID.")
+    for file in files:
+        # Identical bodies are stored once and linked from the inscription id
+        print(f"MIME Type: {file['mime_type']}")
+        print(f"Inscription saved to {file['path']}")
+    save_references(transaction_id, files, store_root)
+
+def save_references(tx_id, files, store_root=DEFAULT_STORE_DIR):
+    # Saves every inscription the extracted recursive inscriptions load, under its own id
+    resolver = None
+    store = ContentStore(store_root)
+    for index, file in enumerate(files):
+        if not can_reference(file['mime_type']):
+            continue
+        resolver = resolver or RecursiveResolver()
+        resolution = resolver.resolve(f"{tx_id}i{index}")
+        for resolved in resolution.dependencies:
+            if resolved.error is not None:
+                print(f"Could not retrieve referenced inscription {resolved.inscription_id}: {resolved.error}")
+                continue
+            path = store.put_inscription(resolved.inscription, resolved.inscription_id)
+            print(f"Referenced inscription saved to {path}")
+        if resolution.truncated:
+            print(f"{len(resolution.truncated)} references are nested too deeply and were not saved.")
+    if resolver is not None:
+        resolver.close()
+
+def read_tx_ids(source):
+    # One txid per line from a file, or from stdin for '-'. Blank lines and
+    # lines starting with '#' are ignored, duplicates are only processed once.
+    file = sys.stdin if source == '-' else open(source)
+    try:
+        tx_ids = [line.strip() for line in file if line.strip() and not line.lstrip().startswith('#')]
+    finally:
+        if file is not sys.stdin:
+            file.close()
+    return list(dict.fromkeys(tx_ids))
+
+def read_finished_tx_ids(manifest_path):
+    # The manifest is append-only, the last line of a txid holds its latest result
+    statuses = {}
+    try:
+        with open(manifest_path) as manifest:
+            for line in manifest:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Line cut off by an interrupted run
+                statuses[entry['txid']] = entry['status']
+    except FileNotFoundError:
+        pass
+    return {tx_id for tx_id, status in statuses.items() if status in _FINISHED_STATUSES}
+
+class Progress(object):
+    # Single line progress bar with transaction and byte throughput, written to stderr
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.bytes_written = 0
+        self.started = time.monotonic()
+
+    def update(self, failed=False, bytes_written=0):
+        self.done += 1
+        self.failed += failed
+        self.bytes_written += bytes_written
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        filled = PROGRESS_BAR_WIDTH * self.done // max(self.total, 1)
+        sys.stderr.write(f"\r[{'#' * filled}{'-' * (PROGRESS_BAR_WIDTH - filled)}] {self.done}/{self.total} "
+                         f"{self.done / elapsed:.1f} tx/s {self.bytes_written / elapsed / 1e6:.2f} MB/s "
+                         f"{self.failed} failed")
+        sys.stderr.flush()
+
+    def finish(self):
+        sys.stderr.write("\n")
+
+def run_batch(tx_ids, store_root=DEFAULT_STORE_DIR, manifest_path=DEFAULT_MANIFEST_FILE,
+              io_workers=ord.HTTP_POOL_SIZE, parse_workers=None, resume=True):
+    # Fetches transactions on a thread pool and hands the raw transactions to a
+    # process pool that parses, decodes and writes them, so the two overlap.
+    # Inscriptions point into the raw transaction and cannot be sent between
+    # processes, which is why parsing, decoding and writing share one worker.
+    # Every result is appended to the manifest. Returns (succeeded, failed) counts.
+    tx_ids = list(dict.fromkeys(tx_id.lower() if is_tx_id(tx_id) else tx_id for tx_id in tx_ids))
+    if resume:
+        finished = read_finished_tx_ids(manifest_path)
+        tx_ids = [tx_id for tx_id in tx_ids if tx_id not in finished]
+    client = ord.get_client()
+    progress = Progress(len(tx_ids))
+    # Bounds the raw transactions held in memory at any time
+    max_in_flight = 2 * (io_workers + (parse_workers or os.cpu_count() or 1))
+    succeeded = failed = 0
+
+    # Workers are spawned rather than forked: forking while the fetch threads hold the
+    # metrics, store or rate limiter locks would leave those locks held in the worker
+    parse_context = multiprocessing.get_context('spawn')
+    with ThreadPoolExecutor(io_workers) as io_pool, \
+            ProcessPoolExecutor(parse_workers, mp_context=parse_context) as parse_pool, \
+            open(manifest_path, 'a') as manifest:
+        pending_tx_ids = iter(tx_ids)
+        in_flight = {}
+
+        def fill():
+            nonlocal failed
+            while len(in_flight) < max_in_flight:
+                tx_id = next(pending_tx_ids, None)
+                if tx_id is None:
+                    return
+                if not is_tx_id(tx_id):
+                    record(tx_id, 'error', error="invalid txid: expected 64 hexadecimal characters")
+                    failed += 1
+                    continue
+                in_flight[io_pool.submit(client.get_raw_transaction, tx_id)] = ('fetch', tx_id)
+
+        def record(tx_id, status, files=(), error=None):
+            entry = {'txid': tx_id, 'status': status, 'files': list(files)}
+            if error is not None:
+                entry['error'] = error
+            manifest.write(json.dumps(entry) + '\n')
+            manifest.flush()
+            progress.update(status == 'error', sum(file['size'] for file in files))
+
+        fill()
+        while in_flight:
+            completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                stage, tx_id = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    record(tx_id, 'error', error=f"{stage} failed: {type(e).__name__}: {e}")
+                    failed += 1
+                    continue
+                if stage == 'fetch':
+                    if result is None:
+                        record(tx_id, 'error', error="fetch failed: could not retrieve transaction")
+                        failed += 1
+                    else:
+                        in_flight[parse_pool.submit(extract_transaction, tx_id, result, store_root)] = ('extract', tx_id)
+                else:
+                    record(tx_id, 'ok' if result else 'no_inscription', result)
+                    succeeded += 1
+            fill()
+    progress.finish()
+    return succeeded, failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Save the inscriptions of Bitcoin transactions to files.")
+    parser.add_argument('--batch', metavar='FILE', help="Read txids from FILE (one per line, '-' for stdin) instead of prompting")
+    parser.add_argument('--output-dir', default=DEFAULT_STORE_DIR, help="Directory the inscriptions are stored in")
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST_FILE, help="Per-transaction result file of batch runs")
+    parser.add_argument('--io-workers', type=int, default=ord.HTTP_POOL_SIZE, help="Concurrent transaction downloads")
+    parser.add_argument('--parse-workers', type=int, default=None, help="Processes parsing and writing (default: CPU count)")
+    parser.add_argument('--no-resume', action='store_true', help="Process transactions the manifest lists as done again")
+    args = parser.parse_args()
+
+    if args.batch is None:
+        interactive(args.output_dir)
+        return 0
+    tx_ids = read_tx_ids(args.batch)
+    succeeded, failed = run_batch(tx_ids, args.output_dir, args.manifest, args.io_workers,
+                                  args.parse_workers, not args.no_resume)
+    print(f"{succeeded} transactions processed, {failed} failed. Results are in {args.manifest}.")
+    return 1 if failed else 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())